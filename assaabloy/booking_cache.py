@@ -0,0 +1,130 @@
+"""
+Cache for booking lookups: an in-process LRU with per-entry expiry, optionally
+backed by a local SQLite file so entries survive between runs.
+
+Bookings that don't exist are cached too (negative entries, stored as None)
+with their own TTL. Bookings in a terminal status will not change again and
+are kept for a long time. Active bookings can still change status, so by
+default (ttl=0) they are not cached at all and a cleanup always acts on
+their current status.
+"""
+import os
+import pickle
+import sqlite3
+import time
+from collections import OrderedDict
+
+TERMINAL_STATUSES = frozenset(['CLOSED', 'CANCELLED'])
+
+SQLITE_CHUNK = 500  # stay well below SQLite's bound-parameter limit
+
+
+class BookingCache:
+
+    def __init__(self, max_entries=100000, ttl=0, terminal_ttl=7 * 86400, negative_ttl=600, path=None,
+                 terminal_statuses=TERMINAL_STATUSES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.terminal_ttl = terminal_ttl
+        self.negative_ttl = negative_ttl
+        self.terminal_statuses = terminal_statuses
+        self.entries = OrderedDict()  # booking ID -> (expires, booking dict or None), oldest first
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS booking_cache (id INTEGER PRIMARY KEY, expires REAL, data BLOB)")
+            self.conn.execute("DELETE FROM booking_cache WHERE expires < ?", (time.time(),))
+            self.conn.commit()
+
+    def _remember(self, booking_id, expires, booking):
+        self.entries[booking_id] = (expires, booking)
+        self.entries.move_to_end(booking_id)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_many(self, booking_ids):
+        """
+        Look up cached bookings. Returns (cached, missing): cached maps booking ID
+        to a booking dict, or to None for a booking known not to exist; missing
+        lists the IDs that have to be fetched.
+        """
+        now = time.time()
+        cached = {}
+        missing = []
+        for booking_id in booking_ids:
+            entry = self.entries.get(booking_id)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(booking_id)
+                cached[booking_id] = entry[1]
+            else:
+                missing.append(booking_id)
+
+        if self.conn is not None and missing:
+            for i in range(0, len(missing), SQLITE_CHUNK):
+                chunk = missing[i:i + SQLITE_CHUNK]
+                rows = self.conn.execute(
+                    f"SELECT id, expires, data FROM booking_cache WHERE id IN ({','.join('?' * len(chunk))})"
+                    " AND expires > ?", chunk + [now])
+                for booking_id, expires, data in rows:
+                    booking = pickle.loads(data) if data is not None else None
+                    self._remember(booking_id, expires, booking)
+                    cached[booking_id] = booking
+            missing = [booking_id for booking_id in missing if booking_id not in cached]
+
+        for booking in cached.values():
+            if booking is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+        self.misses += len(missing)
+        return cached, missing
+
+    def put_many(self, bookings, missing=()):
+        """Cache fetched bookings (booking ID -> dict) and the IDs that were not found."""
+        now = time.time()
+        rows = []
+        for booking_id, booking in bookings.items():
+            ttl = self.terminal_ttl if booking.get('status') in self.terminal_statuses else self.ttl
+            if ttl <= 0:
+                continue
+            self._remember(booking_id, now + ttl, booking)
+            rows.append((booking_id, now + ttl, pickle.dumps(booking, pickle.HIGHEST_PROTOCOL)))
+        for booking_id in missing:
+            self._remember(booking_id, now + self.negative_ttl, None)
+            rows.append((booking_id, now + self.negative_ttl, None))
+        if self.conn is not None and rows:
+            self.conn.executemany("INSERT OR REPLACE INTO booking_cache VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+        }
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def booking_cache_from_env():
+    """Build the cache from BOOKING_CACHE_* settings; None when BOOKING_CACHE_SIZE is 0."""
+    max_entries = int(os.getenv('BOOKING_CACHE_SIZE', '100000'))
+    if max_entries <= 0:
+        return None
+    return BookingCache(
+        max_entries=max_entries,
+        ttl=float(os.getenv('BOOKING_CACHE_TTL', '0')),  # active bookings; 0 = not cached
+        terminal_ttl=float(os.getenv('BOOKING_CACHE_TERMINAL_TTL', str(7 * 86400))),
+        negative_ttl=float(os.getenv('BOOKING_CACHE_MISS_TTL', '600')),
+        path=os.getenv('BOOKING_CACHE_FILE') or None,
+    )
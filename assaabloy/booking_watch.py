@@ -0,0 +1,162 @@
+"""
+Event-driven AA person cleanup driven by the replication stream (track_db.py).
+
+BookingStatusWatcher wraps the sink writer: after each batch of committed
+transactions is written it picks out UPDATEs of reservation.booking whose
+status moved into TO_DELETE_STATUS and hands the booking IDs to an
+AAPersonCleaner. The cleaner debounces them into batches and, on its own
+event loop thread, looks up the AA persons named after each booking and
+deletes them. Cost follows the rate of status changes instead of the size
+of the AA person list.
+
+Without REPLICA IDENTITY FULL on reservation.booking the old row carries no
+status, so every UPDATE that leaves a booking in a delete status is treated
+as a transition; deleting an already deleted person is harmless. Cleanup
+is best effort: booking IDs still queued when the process dies are not
+retried, so the periodic full sweep (clean_aa_persons.py) stays as the
+backstop.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from assaabloy.bookings import TO_DELETE_STATUS, booking_id_from_name
+from assaabloy.client import get_aa_client
+from assaabloy.reconcile import run_bounded
+
+BOOKING_TABLE = 'reservation.booking'
+
+
+class AAPersonCleaner:
+    """Debounce booking IDs and delete their AA persons from a background event loop."""
+
+    def __init__(self, debounce_ms=2000, max_delay_ms=10000, max_batch=500, concurrency=10):
+        self.debounce = debounce_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self.max_batch = max_batch
+        self.concurrency = concurrency
+        self.pending = set()
+        self.first_pending = None
+        self.timer = None
+        self.tasks = set()
+        self.client = None
+        self.deleted = 0
+        self.failed = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='aa-cleanup', daemon=True)
+        self.thread.start()
+        # Log in up front so a bad configuration fails at startup rather than on the first change
+        self.client = asyncio.run_coroutine_threadsafe(self._connect(), self.loop).result()
+
+    async def _connect(self):
+        # A session of its own: the shared one belongs to the main thread's event loop
+        client = await get_aa_client(shared=False)
+        try:
+            await client.login()
+        except BaseException:
+            await client.close()
+            raise
+        return client
+
+    def submit(self, booking_ids):
+        """Queue bookings for cleanup; safe to call from any thread."""
+        self.loop.call_soon_threadsafe(self._add, booking_ids)
+
+    def _add(self, booking_ids):
+        now = time.monotonic()
+        if not self.pending:
+            self.first_pending = now
+        self.pending.update(booking_ids)
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        else:
+            # Wait for the changes to go quiet, but never longer than max_delay overall
+            delay = min(self.debounce, self.first_pending + self.max_delay - now)
+            self.timer = self.loop.call_later(max(delay, 0), self._flush)
+
+    def _flush(self):
+        self.timer = None
+        if not self.pending:
+            return
+        booking_ids = sorted(self.pending)
+        self.pending = set()
+        task = self.loop.create_task(self._cleanup(booking_ids))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _cleanup(self, booking_ids):
+        async def clean_booking(booking_id):
+            persons = await self.client.get_persons_by_booking(str(booking_id))
+            ok = True
+            for person in persons:
+                # The lookup matches on name; only delete persons named after exactly this booking
+                if booking_id_from_name(person['Name']) != booking_id:
+                    continue
+                if await self.client.delete_person(person['ID']):
+                    self.deleted += 1
+                else:
+                    self.failed += 1
+                    ok = False
+            return ok
+
+        await run_bounded(booking_ids, clean_booking, self.concurrency, label='Booking cleanup')
+        logging.info(f"AA cleanup: {self.deleted} persons deleted, {self.failed} failed so far")
+
+    async def _drain(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        self._flush()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.client.close()
+
+    def close(self):
+        """Run the queued cleanups, then stop the event loop thread."""
+        asyncio.run_coroutine_threadsafe(self._drain(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class BookingStatusWatcher:
+    """Sink writer that passes batches on to `writer` and queues AA cleanup for closed bookings."""
+
+    def __init__(self, writer, cleaner, table_name=BOOKING_TABLE, statuses=TO_DELETE_STATUS):
+        self.writer = writer
+        self.cleaner = cleaner
+        self.table_name = table_name
+        self.statuses = frozenset(statuses)
+        self.warned = False
+
+    def _status(self, data):
+        status = data.get('status')
+        if status is None or isinstance(status, str):
+            return status
+        if not self.warned:
+            self.warned = True
+            logging.warning(f"{self.table_name}.status arrives as {type(status).__name__}, not text; "
+                            f"decoding it as UTF-8")
+        return bytes(status).decode('utf-8', errors='replace')
+
+    def write_batch(self, transactions):
+        self.writer.write_batch(transactions)
+        booking_ids = []
+        for transaction in transactions:
+            for row in transaction.rows:
+                if row.op != 'U' or row.table_name != self.table_name or not row.data:
+                    continue
+                if self._status(row.data) in self.statuses and (
+                        row.old is None or self._status(row.old) not in self.statuses):
+                    booking_ids.append(int(row.data['id']))  # text in text mode, int in binary mode
+        if booking_ids:
+            self.cleaner.submit(booking_ids)
+
+    def close(self):
+        try:
+            self.writer.close()
+        finally:
+            self.cleaner.close()
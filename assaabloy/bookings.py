@@ -0,0 +1,21 @@
+"""
+Booking conventions shared by the AA cleanup tools.
+"""
+import logging
+
+# Booking statuses whose AA persons should be removed
+TO_DELETE_STATUS = ['TO_BE_CANCELLED', 'CLOSED', 'TO_BE_CLOSED']
+
+
+# Booking ID embedded at the end of an AA person name ("<...>_<...>_<booking id>"), or None
+def booking_id_from_name(person_name):
+    # Split name using underscore
+    parts = person_name.split('_')
+    if len(parts) <= 2:
+        return None
+
+    booking_id = parts[-1]
+    if not (booking_id.isascii() and booking_id.isdigit()):  # isdigit() alone accepts e.g. '²'
+        logging.info(f"Skipping person due to non-numeric booking ID: {person_name}")
+        return None
+    return int(booking_id)
@@ -1,117 +1,163 @@
-import asyncio
 import os
+import sys
 import time
-from dotenv import load_dotenv
-import aiohttp
 import logging
 
+from assaabloy.bookings import TO_DELETE_STATUS, booking_id_from_name
 from assaabloy.client import get_aa_client
-from assaabloy.db_client import get_db_client
+from assaabloy.compact import IdColumn
+from assaabloy.db_client import BOOKING_LOOKUP_CHUNK, get_db_client
+from assaabloy.journal import CleanupJournal, fingerprint
+from assaabloy.reconcile import run_bounded
+from resources import load_env, run
 
 # Load environment variables from .env
-load_dotenv()
+load_env()
 
 # Constants
-TO_DELETE_STATUS = ['TO_BE_CANCELLED', 'CLOSED', 'TO_BE_CLOSED']
+CONCURRENCY = int(os.getenv('CLEAN_CONCURRENCY', '20'))  # AA calls / DB lookups in flight at once
+JOURNAL_FILE = os.getenv('CLEAN_JOURNAL')  # SQLite journal for resumable/incremental runs; unset = none
+MAX_FAILURES = int(os.getenv('CLEAN_MAX_FAILURES', '10'))  # abort after this many failed deletes in a row; 0 = never
 
-# Error handlers
-error_count = 0
-deleted_count = 0
 
-# Sleep function for retrying (no direct equivalent to Javascript's promise)
-async def sleep(ms):
-    await asyncio.sleep(ms / 1000)
+# Delete the person if their booking is finished. Throttling, retries and
+# re-login are handled by the client; a delete that still fails counts as failed.
+async def process_person(person, booking, client):
+    person_id = person['ID']
 
-# Main function to get client, process persons
-async def main():
-    global error_count, deleted_count
+    # Fetch booking details
+    status = booking['status']
+    booking_no = booking['booking_no']
+    date_to = booking['date_to']
 
-    # Placeholder for importing clients based on your tools.
-    db = await get_db_client()
-    client = await get_aa_client()  # Assuming an async method exists for this
-   # Assuming another async method exists for this
+    logging.info(f"Processing: {booking_no}, Status: {status}, To Date: {date_to}")
 
-    start = time.time()  # Track time execution
+    if status in TO_DELETE_STATUS:
+        return await client.delete_person(person_id)
+    return None
 
-    # Fetch persons
-    persons = await client.get_persons()
-    personsb = await client.get_persons_by_booking("661463")
-    persons_ids = [p['ID'] for p in persons]
 
-    # Fetch credentials and filter
-    credentials = await client.get_credentials()
+# Main function to get client, process persons
+async def main():
+    incremental = '--incremental' in sys.argv[1:]
+    journal = None
+    if JOURNAL_FILE:
+        journal = CleanupJournal(JOURNAL_FILE, incremental=incremental)
+        logging.info(f"{'Resuming' if journal.resumed else 'Starting'} run {journal.run_id}"
+                     f"{' (incremental)' if incremental else ''}")
+    elif incremental:
+        logging.error("--incremental needs CLEAN_JOURNAL to be set")
+        return
 
-    exist, notexist = 0, 0
-    for credential in credentials:
-        if credential['PrsId'] not in persons_ids:
-            notexist += 1
-            await client.delete_credential(credential['ID'])  # Assume async call to delete
-        else:
-            exist += 1
+    db = await get_db_client()
+    client = await get_aa_client()
+    try:
+        await clean(db, client, journal)
+        if journal is not None:
+            journal.finish()
+    finally:
+        # The shared pool and HTTP session stay open for resources.run() to close
+        await client.close()
+        await db['close']()
+        if journal is not None:
+            journal.close()
+
+
+async def clean(db, client, journal=None):
+    start = time.time()  # Track time execution
 
+    # Persons are streamed: booking IDs are resolved a chunk at a time and
+    # deletes start while the rest of the list is still downloading. Only the
+    # person IDs are kept for the credential check below, in a compact column.
+    person_ids = IdColumn()
+    candidate_count = 0
+    resolved_count = 0
+    skipped_count = 0
+
+    async def candidate_batches():
+        nonlocal candidate_count
+        batch = []
+        async for person in client.iter_persons():
+            person_ids.append(person['ID'])
+            booking_id = booking_id_from_name(person['Name'])
+            if booking_id is None:
+                continue
+            batch.append((person, booking_id))
+            candidate_count += 1
+            if len(batch) >= BOOKING_LOOKUP_CHUNK:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def matched_persons():
+        nonlocal resolved_count, skipped_count
+        async for batch in candidate_batches():
+            if journal is not None:
+                # Skip persons this run already settled (or, incrementally, a completed run deleted)
+                remaining = journal.unsettled((person, fingerprint(person), booking_id)
+                                              for person, booking_id in batch)
+                skipped_count += len(batch) - len(remaining)
+                batch = remaining
+            else:
+                batch = [(person, None, booking_id) for person, booking_id in batch]
+
+            bookings = await db['get_bookings_by_ids'](booking_id for _, _, booking_id in batch)
+            resolved_count += len(bookings)
+            for person, person_print, booking_id in batch:
+                if booking_id in bookings:
+                    yield person, person_print, bookings[booking_id]
+                elif journal is not None:
+                    journal.record_person(person['ID'], person_print, 'no_booking')
+
+    async def evaluate(item):
+        person, person_print, booking = item
+        result = await process_person(person, booking, client)
+        if journal is not None:
+            journal.record_person(person['ID'], person_print,
+                                  'kept' if result is None else 'deleted' if result else 'failed')
+        return result
+
+    # Delete persons whose booking status matches TO_DELETE_STATUS
+    _, failed = await run_bounded(matched_persons(), evaluate, CONCURRENCY, label='Persons',
+                                  max_failures=MAX_FAILURES or None)
+    logging.info(f"Resolved {resolved_count} bookings for {candidate_count} persons"
+                 f" ({skipped_count} skipped as already settled)")
+    if db['cache'] is not None:
+        logging.info(f"Booking cache: {db['cache'].stats()}")
+    logging.info(f"Person Count: {len(person_ids)}")
+    if failed:
+        logging.error(f"Failed to delete {failed} persons")
+
+    # Stream credentials and delete those whose person does not exist
+    person_index = person_ids.index()
+    exist = 0
+    notexist = 0
+
+    async def orphaned_credentials():
+        nonlocal exist, notexist
+        async for credential in client.iter_credentials():
+            if credential['PrsId'] in person_index:
+                exist += 1
+            else:
+                notexist += 1
+                yield credential
+
+    async def delete_credential(credential):
+        result = await client.delete_credential(credential['ID'])
+        if journal is not None:
+            journal.record_credential(credential['ID'], credential['PrsId'], 'deleted' if result else 'failed')
+        return result
+
+    await run_bounded(orphaned_credentials(), delete_credential, CONCURRENCY, label='Orphaned credentials',
+                      max_failures=MAX_FAILURES or None)
     logging.info(f"Exist: {exist}, Not Exist: {notexist}")
 
     stop = time.time() - start  # Execution time
     logging.info(f"Execution Time: {stop} seconds")
-    logging.info(f"Person Count: {len(persons)}")
-
-    # Process persons to check their booking info and delete if TO_DELETE_STATUS matches
-    for person in persons:
-        if error_count > 10:
-            logging.error("Error limit exceeded")
-            return
-
-        person_id = person['ID']
-        person_name = person['Name']
-
-        # Split name using underscore
-        parts = person_name.split('_')
-        if len(parts) <= 2:
-            continue
-
-        booking_id = parts[-1]
-
-        if booking_id.isdigit():
-            booking = await db.get_booking_by_id(booking_id)  # Assume async DB lookup
-
-            if not booking:
-                continue
-
-            # Fetch booking details
-            status = booking.get('status')
-            booking_no = booking.get('booking_no')
-            date_to = booking.get('date_to')
-
-            logging.info(f"Processing: {booking_no}, Status: {status}, To Date: {date_to}, Errors: {error_count}, Deleted: {deleted_count}")
-
-            if status in TO_DELETE_STATUS:
-                try:
-                    await client.delete_person(person_id)  # Attempt person deletion
-                    deleted_count += 1
-                except Exception as e:
-                    error_count += 1
-                    await sleep(5000)
-                    logging.error(f"Failed to delete person {person_name}, ID: {person_id}, Retrying...")
-                    logging.error(e)
-
-                    # Retry deletion after re-login
-                    try:
-                        await client.login()  # Assuming re-login is needed
-                        await client.delete_person(person_id)  # Retry deletion
-                        deleted_count += 1
-                        error_count = 0  # Reset error count after success
-                    except Exception as e2:
-                        logging.error(f"Failed to delete person twice {person_name}, ID: {person_id}")
-                        logging.error(e2)
-                        continue
-        else:
-            logging.info(f"Skipping person due to non-numeric booking ID: {person_name}")
-
-    logging.info(f"Processed {len(persons)} persons.")
-
-# Async client import placeholde
+    logging.info(f"Processed {len(person_ids)} persons.")
 
 
 # Run the script using asyncio event loop
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())
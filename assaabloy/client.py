@@ -1,124 +1,287 @@
+import asyncio
 import os
-import requests
-import urllib3
+import time
+from contextlib import asynccontextmanager
 
-# Disable SSL warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+import aiohttp
 
+from assaabloy.json_stream import iter_json_list
+from assaabloy.policy import AAError, AIMDLimiter, AuthError, TokenBucket, backoff_delay, retry_after
+from resources import get_http_session, load_env, run, timed
 
-# Function to create API Client
-def get_aa_client():
+STREAM_CHUNK_SIZE = 64 * 1024
 
-    # Load sensitive variables from environment
-    api_prod = os.getenv('API_PROD')
-    api_dev = os.getenv('API_DEV')
-    base_url = api_prod  # You can switch to api_dev for development when needed.
-    # base_url = api_dev
-    username = os.getenv('API_USERNAME')
-    password = os.getenv('API_PASSWORD')
-    vid = os.getenv('API_VID')
+AUTH_FAILURE_STATUSES = frozenset([401, 403])
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class AAClient:
+    """
+    Async client for the AA REST API.
+
+    All requests share one aiohttp session, so connections are pooled and kept
+    alive between calls, and any number of calls can be in flight at once from
+    the event loop (up to max_connections). Use as an async context manager or
+    call open()/close() explicitly. A session passed in (e.g. the process-wide
+    one from resources.get_http_session()) is used as is and not closed.
+
+    Every request passes the rate limiter and the adaptive concurrency limit
+    (see policy.py). Throttling, server errors and connection errors are
+    retried with backoff; an expired API key triggers one shared re-login and
+    the request is retried. AAError is raised once the retries are used up, and
+    AuthError if the request is refused again after a re-login.
+    The first authenticated request logs in if login() has not been called.
+    """
+
+    def __init__(self, base_url, username, password, vid, max_connections=20, max_connections_per_host=0,
+                 timeout=60, connect_timeout=10, keepalive_timeout=30, verify_ssl=False,
+                 rate_limit=50.0, burst=None, initial_concurrency=4, min_concurrency=1, latency_target=None,
+                 max_attempts=6, backoff_base=0.5, backoff_cap=30.0, session=None):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.vid = vid
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.keepalive_timeout = keepalive_timeout
+        self.verify_ssl = verify_ssl
+        self.rate_limiter = TokenBucket(rate_limit, burst)
+        self.concurrency = AIMDLimiter(initial_concurrency, min_concurrency, max_connections,
+                                       latency_target=latency_target)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.api_key = None
+        self.session = session
+        self.owns_session = False  # set by open() when it creates the session
+        self._login_task = None  # in-progress re-login shared by all requests that hit an auth failure
 
-    api_key = None
+    async def open(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ssl=None if self.verify_ssl else False,  # the controller uses a self-signed certificate
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self.owns_session = True
+        return self
 
-    # Create a session to persist HTTP connection across requests
-    session = requests.Session()
-    session.verify = False  # Disable SSL verification
+    async def close(self):
+        if self.session is not None:
+            if self.owns_session:
+                await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @asynccontextmanager
+    async def _response(self, method, path, json=None, authenticated=True, timeout=None):
+        """
+        Send a request under the rate and concurrency limits, retrying until a
+        final response; yields that response for the caller to read.
+        """
+        url = f"{self.base_url}{path}"
+        if authenticated and self.api_key is None:
+            await self._relogin(None)  # not logged in yet
+        relogged = False
+        for attempt in range(self.max_attempts):
+            api_key = self.api_key
+            params = {"apiKey": api_key} if authenticated else None
+            delay = None
+            await self.rate_limiter.acquire()
+            await self.concurrency.acquire()
+            released = False
+            try:
+                started = time.monotonic()
+                try:
+                    resp = await self.session.request(method, url, json=json, params=params,
+                                                      timeout=timeout or self.timeout)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.concurrency.congested()
+                    error = AAError(f"{method} {path}: {e!r}")
+                else:
+                    status = resp.status
+                    if status in RETRY_STATUSES:
+                        self.concurrency.congested()
+                        delay = retry_after(resp.headers)
+                        error = AAError(f"{method} {path}: {status} - {await resp.text()}", status)
+                        resp.release()
+                    elif authenticated and status in AUTH_FAILURE_STATUSES:
+                        error = AAError(f"{method} {path}: {status} - {await resp.text()}", status)
+                        resp.release()
+                    else:
+                        self.concurrency.succeeded(time.monotonic() - started)
+                        await self.concurrency.release()
+                        released = True
+                        try:
+                            yield resp
+                        finally:
+                            resp.release()
+                        return
+            finally:
+                if not released:
+                    await self.concurrency.release()
+
+            if error.status in AUTH_FAILURE_STATUSES:
+                if relogged:  # a fresh key did not help: forbidden, not expired
+                    raise AuthError(str(error), error.status)
+                relogged = True
+                await self._relogin(api_key)
+            elif attempt + 1 < self.max_attempts:
+                await asyncio.sleep(delay if delay is not None
+                                    else backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+        raise error
+
+    async def _request(self, method, path, json=None, authenticated=True):
+        """Send one request. Returns (status, parsed JSON body, response text on failure)."""
+        async with self._response(method, path, json=json, authenticated=authenticated) as resp:
+            if resp.status == 200:
+                return resp.status, await resp.json(content_type=None), None  # None for an empty body
+            return resp.status, None, await resp.text()
+
+    async def _stream_list(self, path, key, what):
+        """Yield the elements of the list `key` in a GET response while the body downloads."""
+        # No total timeout for large bodies: only a stalled read aborts the download
+        timeout = aiohttp.ClientTimeout(total=None, connect=self.timeout.connect, sock_read=self.timeout.total)
+        async with self._response("GET", path, timeout=timeout) as resp:
+            if resp.status != 200:
+                raise AAError(f"Failed to get {what}: {resp.status} - {await resp.text()}", resp.status)
+            async for item in iter_json_list(resp.content.iter_chunked(STREAM_CHUNK_SIZE), key):
+                yield item
+
+    async def _relogin(self, stale_api_key):
+        """Log in again after an auth failure, once for all requests that saw the same stale key."""
+        if self.api_key != stale_api_key:
+            return  # another request already logged in again
+        if self._login_task is None or self._login_task.done():
+            self._login_task = asyncio.ensure_future(self.login())
+        await asyncio.shield(self._login_task)
 
     # Login function to get the API key
-    def login():
-        nonlocal api_key
-        url = f"{base_url}/login"
-        resp = session.post(url, json={
-            "UserName": username,
-            "Password": password,
-            "VID": vid
-        })
-
-        if resp.status_code == 200:
-            api_key = resp.json()  # Assuming the API key is returned as the response
-            print(f"API Key: {api_key}")
-        else:
-            print(f"Failed to login: {resp.status_code} - {resp.text}")
-
-    # Function to get persons
-    def get_persons():
-        url = f"{base_url}/persons"
-        resp = session.get(url, params={"apiKey": api_key})
-
-        if resp.status_code == 200:
-            return resp.json().get("PersonList", [])
-        else:
-            print(f"Failed to get persons: {resp.status_code} - {resp.text}")
-            return []
-
-    # Function to get persons by booking
-    def get_persons_by_booking(name):
-        url = f"{base_url}/persons/"
-        resp = session.post(url, json={
-            "Name": name,
-        }, params={"apiKey": api_key})
-
-        if resp.status_code == 200:
-            return resp.json().get("PersonList", [])
-        else:
-            print(f"Failed to get persons by booking: {resp.status_code} - {resp.text}")
-            return []
-
-    # Function to get credentials
-    def get_credentials():
-        url = f"{base_url}/credentials"
-        resp = session.get(url, params={"apiKey": api_key})
-
-        if resp.status_code == 200:
-            return resp.json().get("CredentialList", [])
-        else:
-            print(f"Failed to get credentials: {resp.status_code} - {resp.text}")
-            return []
-
-    # Function to delete a person
-    def delete_person(person_id):
-        url = f"{base_url}/persons"
-        resp = session.delete(url, json={"ID": person_id}, params={"apiKey": api_key})
-
-        if resp.status_code == 200:
+    async def login(self):
+        with timed('aa login'):
+            status, body, text = await self._request("POST", "/login", json={
+                "UserName": self.username,
+                "Password": self.password,
+                "VID": self.vid,
+            }, authenticated=False)
+
+        if status != 200 or not body:
+            raise AuthError(f"Failed to login: {status} - {text}", status)
+        self.api_key = body  # The API key is returned as the response
+        print(f"Logged in to {self.base_url}")
+
+    async def get_persons(self):
+        status, body, text = await self._request("GET", "/persons")
+
+        if status != 200:
+            raise AAError(f"Failed to get persons: {status} - {text}", status)
+        return body.get("PersonList", [])
+
+    def iter_persons(self):
+        """Stream persons one by one; processing can start before the list has downloaded."""
+        return self._stream_list("/persons", "PersonList", "persons")
+
+    async def get_persons_by_booking(self, name):
+        status, body, text = await self._request("POST", "/persons/", json={"Name": name})
+
+        if status != 200:
+            raise AAError(f"Failed to get persons by booking: {status} - {text}", status)
+        return body.get("PersonList", [])
+
+    async def get_credentials(self):
+        status, body, text = await self._request("GET", "/credentials")
+
+        if status != 200:
+            raise AAError(f"Failed to get credentials: {status} - {text}", status)
+        return body.get("CredentialList", [])
+
+    def iter_credentials(self):
+        """Stream credentials one by one; processing can start before the list has downloaded."""
+        return self._stream_list("/credentials", "CredentialList", "credentials")
+
+    async def delete_person(self, person_id):
+        """Delete a person. Returns True on success."""
+        status, _, text = await self._request("DELETE", "/persons", json={"ID": person_id})
+
+        if status == 200:
             print(f"Person {person_id} deleted successfully")
-        else:
-            print(f"Failed to delete person: {resp.status_code} - {resp.text}")
+            return True
+        print(f"Failed to delete person: {status} - {text}")
+        return False
 
-    # Function to delete a credential
-    def delete_credential(credential_id):
-        url = f"{base_url}/credentials"
-        resp = session.delete(url, json={"ID": credential_id}, params={"apiKey": api_key})
+    async def delete_credential(self, credential_id):
+        """Delete a credential. Returns True on success."""
+        status, _, text = await self._request("DELETE", "/credentials", json={"ID": credential_id})
 
-        if resp.status_code == 200:
+        if status == 200:
             print(f"Credential {credential_id} deleted successfully")
-        else:
-            print(f"Failed to delete credential: {resp.status_code} - {resp.text}")
+            return True
+        print(f"Failed to delete credential: {status} - {text}")
+        return False
 
-    # Call login to initialize the API key
-    login()
 
-    # Maintain structure similar to JavaScript functions return
-    return {
-        "get_persons": get_persons,
-        "get_persons_by_booking": get_persons_by_booking,
-        "get_credentials": get_credentials,
-        "delete_person": delete_person,
-        "delete_credential": delete_credential,
-    }
+# Create an API client from the environment. It logs in on its first request; with
+# shared=True it uses the process-wide HTTP session instead of opening its own.
+async def get_aa_client(shared=True):
+    load_env()
 
-# Example usage:
-if __name__ == "__main__":
-    client = get_aa_client()
+    # Load sensitive variables from environment
+    api_prod = os.getenv('API_PROD')
+    api_dev = os.getenv('API_DEV')
+    base_url = api_prod  # You can switch to api_dev for development when needed.
+    # base_url = api_dev
 
-    # Fetch persons
-    persons = client["get_persons"]()
-    print("Persons:", persons)
+    max_connections = int(os.getenv('API_MAX_CONNECTIONS', '20'))
+    max_connections_per_host = int(os.getenv('API_MAX_CONNECTIONS_PER_HOST', '0'))  # 0 = no per-host cap
+    keepalive_timeout = float(os.getenv('API_KEEPALIVE_TIMEOUT', '30'))
+    session = None
+    if shared:
+        session = await get_http_session(limit=max_connections, limit_per_host=max_connections_per_host,
+                                         keepalive_timeout=keepalive_timeout,
+                                         ssl=False)  # the controller uses a self-signed certificate
+    client = AAClient(
+        base_url,
+        os.getenv('API_USERNAME'),
+        os.getenv('API_PASSWORD'),
+        os.getenv('API_VID'),
+        max_connections=max_connections,
+        max_connections_per_host=max_connections_per_host,
+        timeout=float(os.getenv('API_TIMEOUT', '60')),
+        connect_timeout=float(os.getenv('API_CONNECT_TIMEOUT', '10')),
+        keepalive_timeout=keepalive_timeout,
+        rate_limit=float(os.getenv('API_RATE_LIMIT', '50')),  # requests per second, 0 = unlimited
+        burst=float(os.getenv('API_BURST', '0')) or None,
+        initial_concurrency=int(os.getenv('API_INITIAL_CONCURRENCY', '4')),
+        latency_target=float(os.getenv('API_LATENCY_TARGET', '0')) or None,  # seconds, 0 = ignore latency
+        max_attempts=int(os.getenv('API_MAX_ATTEMPTS', '6')),
+        backoff_base=float(os.getenv('API_BACKOFF_BASE', '0.5')),
+        backoff_cap=float(os.getenv('API_BACKOFF_CAP', '30')),
+        session=session,
+    )
+    return await client.open()
 
-    # Fetch credentials
-    credentials = client["get_credentials"]()
-    print("Credentials:", credentials)
 
-    # Fetch persons by booking name
-    persons_by_booking = client["get_persons_by_booking"]("John Doe")
-    print("Persons by Booking:", persons_by_booking)
+# Example usage:
+async def example():
+    async with await get_aa_client() as client:
+        # Independent calls run concurrently over the pooled connections
+        persons, credentials, persons_by_booking = await asyncio.gather(
+            client.get_persons(),
+            client.get_credentials(),
+            client.get_persons_by_booking("John Doe"),
+        )
+        print("Persons:", persons)
+        print("Credentials:", credentials)
+        print("Persons by Booking:", persons_by_booking)
+
+
+if __name__ == "__main__":
+    run(example())
@@ -0,0 +1,65 @@
+"""
+Compact ID columns for the person/credential join of clean_aa_persons.py.
+
+The cleanup streams persons and credentials and only keeps the person IDs,
+for the check of every credential's PrsId. Integer IDs live in an array('q')
+column (8 bytes each instead of a set entry plus an int object); the column
+falls back to a plain list if the API hands out non-integer IDs. Membership
+tests use a sorted copy of the column searched with bisect rather than a set.
+"""
+from array import array
+from bisect import bisect_left
+
+
+class IdColumn:
+    """Append-only ID column: a signed 64-bit array while every ID is an int, a list otherwise."""
+
+    __slots__ = ('values',)
+
+    def __init__(self):
+        self.values = array('q')
+
+    def append(self, value):
+        if type(self.values) is array:
+            if type(value) is int:
+                try:
+                    self.values.append(value)
+                    return
+                except OverflowError:
+                    pass
+            self.values = list(self.values)
+        self.values.append(value)
+
+    def index(self):
+        """Membership index over the column's current contents."""
+        if type(self.values) is array:
+            return SortedIds(self.values)
+        return frozenset(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+class SortedIds:
+    """Set-like membership test over integer IDs, stored as one sorted array."""
+
+    __slots__ = ('values',)
+
+    def __init__(self, ids):
+        self.values = array('q', sorted(ids))
+
+    def __contains__(self, value):
+        if type(value) is not int:
+            return False
+        values = self.values
+        i = bisect_left(values, value)
+        return i < len(values) and values[i] == value
+
+    def __len__(self):
+        return len(self.values)
@@ -1,32 +1,35 @@
 import os
-import asyncpg
-from dotenv import load_dotenv
+
+from assaabloy.booking_cache import booking_cache_from_env
+from resources import get_pool, load_env, run
 
 # Load environment variables from .env
-load_dotenv()
+load_env()
+
+# Only the columns the cleanup tools read
+GET_BOOKINGS_BY_IDS_QUERY = """
+SELECT id, status, booking_no, date_to
+FROM reservation.booking
+WHERE id = ANY($1)
+"""
+BOOKING_LOOKUP_CHUNK = int(os.getenv('BOOKING_LOOKUP_CHUNK', '5000'))
 
-async def get_db_client():
+
+async def get_db_client(cache=None, pool=None, **pool_options):
     """
     This function creates an asynchronous connection to the PostgreSQL database 
     and returns a client object with a method to query bookings by ID.
-    """
 
-    # Fetch database credentials from environment variables
-    db_host = os.getenv('DB_HOST')
-    db_port = os.getenv('DB_PORT')  # PostgreSQL default port
-    db_user = os.getenv('DB_USER')
-    db_password = os.getenv('DB_PASSWORD')
-    db_name = os.getenv('DB_NAME')
-
-    # Create a connection pool for PostgreSQL using asyncpg
-    pool = await asyncpg.create_pool(
-        host=db_host,
-        port=db_port,
-        user=db_user,
-        password=db_password,
-        database=db_name,
-        ssl=False  # Set SSL to meet specific requirements (adjust if needed)
-    )
+    Bulk booking lookups go through a BookingCache; by default one is built
+    from the BOOKING_CACHE_* environment settings. Queries run on the given
+    pool, by default the process-wide one from resources.get_pool(), which
+    extra keyword arguments are passed to if it does not exist yet. close()
+    leaves the pool open; resources.run() closes it.
+    """
+    if cache is None:
+        cache = booking_cache_from_env()
+    if pool is None:
+        pool = await get_pool(**pool_options)
 
     # Define the get_booking_by_id as an inner function
     async def get_booking_by_id(booking_id):
@@ -40,9 +43,40 @@ async def get_db_client():
             row = await conn.fetchrow(sql, booking_id)  # Fetch a single row
             return row
 
+    async def get_bookings_by_ids(booking_ids, chunk_size=BOOKING_LOOKUP_CHUNK):
+        """
+        Retrieve many bookings in a few round trips. Returns a dict of booking ID
+        to booking dict; IDs that don't exist are absent.
+        """
+        booking_ids = list(dict.fromkeys(booking_ids))  # de-duplicate, keep order
+        bookings = {}
+        if cache is not None:
+            cached, booking_ids = cache.get_many(booking_ids)
+            bookings.update((booking_id, booking) for booking_id, booking in cached.items() if booking is not None)
+        if not booking_ids:
+            return bookings
+
+        fetched = {}
+        async with pool.acquire() as conn:
+            statement = await conn.prepare(GET_BOOKINGS_BY_IDS_QUERY)
+            for i in range(0, len(booking_ids), chunk_size):
+                for row in await statement.fetch(booking_ids[i:i + chunk_size]):
+                    fetched[row['id']] = dict(row)
+        if cache is not None:
+            cache.put_many(fetched, [booking_id for booking_id in booking_ids if booking_id not in fetched])
+        bookings.update(fetched)
+        return bookings
+
+    async def close():
+        if cache is not None:
+            cache.close()
+
     # Return client functions
     return {
         'get_booking_by_id': get_booking_by_id,
+        'get_bookings_by_ids': get_bookings_by_ids,
+        'cache': cache,
+        'close': close,
         'pool': pool  # Exposes the connection pool if needed for other queries
     }
 
@@ -58,5 +92,4 @@ async def example_query():
 
 # Run the example
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(example_query())
+    run(example_query())
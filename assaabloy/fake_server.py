@@ -0,0 +1,171 @@
+"""
+Local stand-in for the AA REST API, for load tests and benchmarks.
+
+Serves /login, /persons (GET list, POST search by name, DELETE),
+/credentials (GET list, DELETE) and /_stats with seeded synthetic data.
+Latency, the share of requests failing with 503, a request rate above which
+requests get 429 with Retry-After, and API key expiry are configurable.
+
+Persons are named "Guest_<n>_<booking id>" for booking IDs 1..persons, so
+they line up with the bookings seeded by bench_fixture.py. There are about
+1.2 credentials per person, 5% of them pointing at persons that don't exist.
+
+Usage: python -m assaabloy.fake_server [--persons=10000] [--port=8088] [--latency-ms=2]
+           [--error-rate=0] [--rate-limit=0] [--key-ttl=0]
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+
+from aiohttp import web
+
+LIST_CHUNK = 1000  # records per write of a streamed list
+
+
+class FakeAA:
+
+    def __init__(self, persons=10000, latency=0.002, error_rate=0.0, rate_limit=0.0, key_ttl=0.0, seed=1):
+        self.person_count = persons
+        self.credential_count = persons * 6 // 5
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.key_ttl = key_ttl
+        self.random = random.Random(seed)
+        self.deleted_persons = set()
+        self.deleted_credentials = set()
+        self.keys = {}  # API key -> expiry (monotonic), 0 = never
+        self.tokens = rate_limit
+        self.tokens_updated = time.monotonic()
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'unauthorized': 0}
+
+    # Seeded data, generated on the fly so a million persons cost no memory up front
+    def person(self, i):
+        return {"ID": 100000 + i, "Name": f"Guest_{i % 977}_{i + 1}", "Type": 1,
+                "ValidFrom": "2026-01-01T00:00:00", "ValidTo": "2026-12-31T23:59:59"}
+
+    def credential(self, i):
+        orphan = i % 20 == 0
+        return {"ID": 900000 + i, "PrsId": 100000 + i * 5 // 6 + (self.person_count if orphan else 0),
+                "Card": f"{i:016X}", "Type": 2}
+
+    def _allow(self):
+        """Token bucket for the throttling simulation; True if the request may proceed."""
+        if self.rate_limit <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.rate_limit, self.tokens + (now - self.tokens_updated) * self.rate_limit)
+        self.tokens_updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        self.stats['requests'] += 1
+        self.stats[request.path] = self.stats.get(request.path, 0) + 1
+        if request.path == '/_stats':
+            return await handler(request)
+        if not self._allow():
+            self.stats['throttled'] += 1
+            return web.Response(status=429, headers={'Retry-After': '1'}, text='Too many requests')
+        if self.latency:
+            await asyncio.sleep(self.latency * self.random.uniform(0.5, 1.5))
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return web.Response(status=503, text='Service unavailable')
+        if request.path != '/login':
+            expiry = self.keys.get(request.query.get('apiKey'))
+            if expiry is None or (expiry and expiry < time.monotonic()):
+                self.stats['unauthorized'] += 1
+                return web.Response(status=401, text='Invalid API key')
+        return await handler(request)
+
+    async def login(self, request):
+        await request.json()
+        key = uuid.uuid4().hex
+        self.keys[key] = time.monotonic() + self.key_ttl if self.key_ttl else 0
+        return web.json_response(key)
+
+    async def _stream_list(self, request, key, count, make, deleted):
+        response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+        await response.prepare(request)
+        await response.write(f'{{"{key}": ['.encode())
+        first = True
+        for start in range(0, count, LIST_CHUNK):
+            records = [make(i) for i in range(start, min(start + LIST_CHUNK, count))]
+            records = [json.dumps(r) for r in records if r["ID"] not in deleted]
+            if records:
+                await response.write(((',' if not first else '') + ','.join(records)).encode())
+                first = False
+        await response.write(b']}')
+        await response.write_eof()
+        return response
+
+    async def get_persons(self, request):
+        return await self._stream_list(request, "PersonList", self.person_count, self.person,
+                                       self.deleted_persons)
+
+    async def get_credentials(self, request):
+        return await self._stream_list(request, "CredentialList", self.credential_count, self.credential,
+                                       self.deleted_credentials)
+
+    async def find_persons(self, request):
+        name = (await request.json()).get("Name", "")
+        persons = []
+        if name.isdigit() and 1 <= int(name) <= self.person_count:
+            person = self.person(int(name) - 1)
+            if person["ID"] not in self.deleted_persons:
+                persons.append(person)
+        return web.json_response({"PersonList": persons})
+
+    async def delete_person(self, request):
+        person_id = (await request.json())["ID"]
+        if person_id in self.deleted_persons or not 100000 <= person_id < 100000 + self.person_count:
+            return web.Response(status=404, text='No such person')
+        self.deleted_persons.add(person_id)
+        return web.Response()
+
+    async def delete_credential(self, request):
+        credential_id = (await request.json())["ID"]
+        if credential_id in self.deleted_credentials or not 900000 <= credential_id < 900000 + self.credential_count:
+            return web.Response(status=404, text='No such credential')
+        self.deleted_credentials.add(credential_id)
+        return web.Response()
+
+    async def get_stats(self, request):
+        return web.json_response(dict(self.stats, deleted_persons=len(self.deleted_persons),
+                                      deleted_credentials=len(self.deleted_credentials)))
+
+    def app(self):
+        app = web.Application(middlewares=[self.middleware])
+        app.add_routes([
+            web.post('/login', self.login),
+            web.get('/persons', self.get_persons),
+            web.post('/persons/', self.find_persons),
+            web.delete('/persons', self.delete_person),
+            web.get('/credentials', self.get_credentials),
+            web.delete('/credentials', self.delete_credential),
+            web.get('/_stats', self.get_stats),
+        ])
+        return app
+
+
+def main():
+    options = dict(a[2:].split('=', 1) for a in sys.argv[1:] if a.startswith('--') and '=' in a)
+    fake = FakeAA(
+        persons=int(options.get('persons', '10000')),
+        latency=float(options.get('latency-ms', '2')) / 1000,
+        error_rate=float(options.get('error-rate', '0')),
+        rate_limit=float(options.get('rate-limit', '0')),
+        key_ttl=float(options.get('key-ttl', '0')),
+    )
+    web.run_app(fake.app(), host='127.0.0.1', port=int(options.get('port', '8088')), print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Local SQLite journal of cleanup runs.
+
+Each run gets a run ID. Every person whose booking was evaluated is recorded
+with the run ID, a fingerprint of the person record and the outcome, and
+every credential deleted (or that failed to delete) is recorded the same way.
+Writes are buffered and committed in small batches.
+
+A run that did not finish is resumed by the next one: persons it already
+settled are skipped. In incremental mode persons are also skipped when a
+completed run deleted them or found no booking for them and their record is
+unchanged since, so only new and changed persons are re-examined. Persons a
+completed run kept are always re-examined: their booking may have moved into
+a delete status since, which the person record does not show.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+SETTLED = frozenset(['kept', 'deleted', 'no_booking'])  # 'failed' is retried
+FINAL = frozenset(['deleted', 'no_booking'])  # also settled for later incremental runs
+SQLITE_CHUNK = 500
+FLUSH_ROWS = 500
+FLUSH_SECONDS = 2.0
+
+
+def fingerprint(record):
+    """Stable short hash of a JSON record."""
+    return hashlib.blake2b(json.dumps(record, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest()
+
+
+class CleanupJournal:
+
+    def __init__(self, path, tool='clean_aa_persons', incremental=False):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS run (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tool TEXT NOT NULL,
+                started REAL NOT NULL,
+                finished REAL
+            );
+            CREATE TABLE IF NOT EXISTS person (
+                person_id TEXT PRIMARY KEY,
+                run_id INTEGER NOT NULL,
+                fingerprint TEXT,
+                outcome TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS credential (
+                credential_id TEXT PRIMARY KEY,
+                run_id INTEGER NOT NULL,
+                person_id TEXT,
+                outcome TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+        """)
+        self.incremental = incremental
+        self.pending_persons = []
+        self.pending_credentials = []
+        self.last_flush = time.monotonic()
+
+        row = self.conn.execute("SELECT max(run_id) FROM run WHERE tool = ? AND finished IS NOT NULL",
+                                (tool,)).fetchone()
+        self.last_completed_run = row[0] or 0
+        row = self.conn.execute("SELECT max(run_id) FROM run WHERE tool = ? AND finished IS NULL AND run_id > ?",
+                                (tool, self.last_completed_run)).fetchone()
+        if row[0] is not None:
+            self.run_id = row[0]
+            self.resumed = True
+        else:
+            self.run_id = self.conn.execute("INSERT INTO run (tool, started) VALUES (?, ?)",
+                                            (tool, time.time())).lastrowid
+            self.resumed = False
+        self.conn.commit()
+
+    def unsettled(self, items):
+        """
+        Filter (person, fingerprint, ...) tuples down to those whose person still
+        needs to be evaluated in this run.
+        """
+        items = list(items)
+        settled = {}
+        ids = [str(item[0]['ID']) for item in items]
+        for i in range(0, len(ids), SQLITE_CHUNK):
+            chunk = ids[i:i + SQLITE_CHUNK]
+            for person_id, run_id, stored, outcome in self.conn.execute(
+                    f"SELECT person_id, run_id, fingerprint, outcome FROM person"
+                    f" WHERE person_id IN ({','.join('?' * len(chunk))})"
+                    f" AND outcome IN ({','.join('?' * len(SETTLED))})", chunk + sorted(SETTLED)):
+                settled[person_id] = (run_id, stored, outcome)
+
+        remaining = []
+        for item, person_id in zip(items, ids):
+            entry = settled.get(person_id)
+            if entry is not None:
+                run_id, settled_print, outcome = entry
+                if run_id == self.run_id:
+                    continue  # already done by the run being resumed
+                if (self.incremental and outcome in FINAL and run_id <= self.last_completed_run
+                        and settled_print == item[1]):
+                    continue  # unchanged since a completed run deleted it or found no booking
+            remaining.append(item)
+        return remaining
+
+    def record_person(self, person_id, person_print, outcome):
+        self.pending_persons.append((str(person_id), self.run_id, person_print, outcome, time.time()))
+        self._maybe_flush()
+
+    def record_credential(self, credential_id, person_id, outcome):
+        self.pending_credentials.append((str(credential_id), self.run_id, str(person_id), outcome, time.time()))
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if (len(self.pending_persons) + len(self.pending_credentials) >= FLUSH_ROWS
+                or time.monotonic() - self.last_flush >= FLUSH_SECONDS):
+            self.flush()
+
+    def flush(self):
+        if self.pending_persons:
+            self.conn.executemany("INSERT OR REPLACE INTO person VALUES (?, ?, ?, ?, ?)", self.pending_persons)
+            self.pending_persons = []
+        if self.pending_credentials:
+            self.conn.executemany("INSERT OR REPLACE INTO credential VALUES (?, ?, ?, ?, ?)",
+                                  self.pending_credentials)
+            self.pending_credentials = []
+        self.conn.commit()
+        self.last_flush = time.monotonic()
+
+    def finish(self):
+        """Mark the run completed; the next run starts fresh instead of resuming."""
+        self.flush()
+        self.conn.execute("UPDATE run SET finished = ? WHERE run_id = ?", (time.time(), self.run_id))
+        self.conn.commit()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
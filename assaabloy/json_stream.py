@@ -0,0 +1,100 @@
+"""
+Incremental parsing of one list out of a JSON object, e.g. the PersonList in
+{"PersonList": [{...}, {...}, ...]}, from a stream of byte chunks.
+
+Elements are decoded with json's raw_decode as soon as they are complete
+(followed by ',' or ']'), so the caller gets the first records while the
+rest of the body is still downloading and never holds more than one chunk
+plus one element of text.
+The list key is located by searching for the quoted key followed by ':', so
+it must not also appear as a string value earlier in the document; the AA
+responses have the list at the top level.
+"""
+import codecs
+import json
+import re
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+_decoder = json.JSONDecoder()
+
+
+class ListStreamParser:
+    """Feed text chunks, collect complete list elements."""
+
+    def __init__(self, key):
+        self.key = key
+        # The key and the first character of its value
+        self.key_pattern = re.compile(r'"%s"\s*:\s*(?=\S)' % re.escape(key))
+        self.key_tail = len(key) + 16  # text kept between chunks while the key may be split
+        self.buf = ''
+        self.in_list = False
+        self.done = False
+
+    def feed(self, text, final=False):
+        """Add text; returns the list elements completed by it."""
+        if self.done:
+            return []
+        buf = self.buf + text
+        pos = 0
+        if not self.in_list:
+            match = self.key_pattern.search(buf)
+            if match is None:
+                self.buf = buf if final else buf[-self.key_tail:]
+                return []
+            if buf[match.end()] != '[':
+                raise ValueError(f"{self.key!r} does not hold a list")
+            self.in_list = True
+            pos = match.end() + 1
+
+        items = []
+        end = len(buf)
+        while True:
+            pos = WHITESPACE.match(buf, pos).end()
+            if pos < end and buf[pos] == ',':
+                pos = WHITESPACE.match(buf, pos + 1).end()
+            if pos >= end:
+                break
+            if buf[pos] == ']':
+                self.done = True
+                break
+            try:
+                item, item_end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break  # element not complete yet
+            # Only a following ',' or ']' completes it: raw_decode also accepts the
+            # prefix of a scalar cut at a chunk boundary ('1.5' of '1.5e3')
+            after = WHITESPACE.match(buf, item_end).end()
+            if after >= end or buf[after] not in ',]':
+                if not final:
+                    break
+                if after < end:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buf, after)
+            items.append(item)
+            pos = after
+        self.buf = '' if self.done else buf[pos:]
+        return items
+
+    def close(self):
+        """Signal the end of input; raises if the list was missing or left unterminated."""
+        items = self.feed('', final=True)
+        if not self.in_list:
+            raise ValueError(f"no {self.key!r} list in the JSON document")
+        if not self.done:
+            raise ValueError("JSON list ended before its closing ']'")
+        return items
+
+
+async def iter_json_list(chunks, key, encoding='utf-8'):
+    """Yield the elements of the list under `key` from an async iterable of byte chunks."""
+    parser = ListStreamParser(key)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    async for chunk in chunks:
+        for item in parser.feed(decoder.decode(chunk)):
+            yield item
+        if parser.done:
+            return
+    for item in parser.feed(decoder.decode(b'', final=True)) + parser.close():
+        yield item
@@ -0,0 +1,103 @@
+"""
+Request policy for the AA API: a token-bucket rate limit, an AIMD concurrency
+limit and exponential backoff with jitter.
+
+The concurrency limit grows by roughly one slot per window of successful
+requests and halves when the controller pushes back (429, 5xx, connection
+errors or responses slower than the latency target), so the client settles
+at the highest load the controller tolerates instead of a guessed constant.
+"""
+import asyncio
+import random
+import time
+
+
+class AAError(Exception):
+    """A request to the AA API failed for good."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class AuthError(AAError):
+    """Logging in to the AA API failed."""
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return  # unlimited
+        async with self.lock:  # waiters are served in order
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AIMDLimiter:
+    """Adaptive limit on requests in flight: additive increase, multiplicative decrease."""
+
+    def __init__(self, initial=4, minimum=1, maximum=64, decrease_factor=0.5, latency_target=None):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def succeeded(self, latency):
+        if self.latency_target is not None and latency > self.latency_target:
+            self.congested()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)  # about +1 per window of requests
+
+    def congested(self):
+        # Only back off once per burst of failures: requests already in flight
+        # when the first one failed would otherwise each halve the limit again
+        now = time.monotonic()
+        if now - self.last_decrease < 1.0:
+            return
+        self.last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Exponential backoff with full jitter for the given 0-based retry attempt."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after(headers):
+    """Seconds from a Retry-After header in seconds form, or None."""
+    value = headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None  # HTTP-date form; fall back to our own backoff
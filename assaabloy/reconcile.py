@@ -0,0 +1,87 @@
+"""
+Bounded-concurrency executor for the AA deletions.
+"""
+import asyncio
+import logging
+import time
+
+_END = object()
+
+
+class TooManyFailures(Exception):
+    """run_bounded stopped after max_failures calls in a row failed."""
+
+
+async def run_bounded(items, action, concurrency=20, label='items', report_interval=5.0, max_failures=None):
+    """
+    Await action(item) for every item with at most `concurrency` calls in flight.
+
+    A fixed set of workers pulls from one iterator, so no task is created per
+    item and items can come from a generator or an async iterator that is
+    still being produced (e.g. a streamed download). A call that raises or returns
+    False counts as failed. Progress is logged at most every report_interval
+    seconds. Returns (succeeded, failed). If pulling the next item raises, the
+    other workers are cancelled and awaited before the error propagates.
+
+    With max_failures set, no more items are started once that many calls
+    have failed without a success in between (e.g. the AA API is down); the calls in flight finish
+    and TooManyFailures is raised.
+    """
+    total = len(items) if hasattr(items, '__len__') else None
+    if hasattr(items, '__aiter__'):
+        iterator = aiter(items)
+        lock = asyncio.Lock()  # an async generator can't be advanced by two workers at once
+
+        async def next_item():
+            async with lock:
+                return await anext(iterator, _END)
+    else:
+        iterator = iter(items)
+
+        async def next_item():
+            return next(iterator, _END)
+
+    counts = [0, 0]  # succeeded, failed
+    consecutive_failures = 0
+    start = last_report = time.monotonic()
+
+    def report(final=False):
+        done = counts[0] + counts[1]
+        elapsed = max(time.monotonic() - start, 1e-9)
+        of_total = f"/{total}" if total is not None else ''
+        logging.info(f"{label}: {done}{of_total} done ({counts[1]} failed), {done / elapsed:.1f}/s"
+                     + (f" in {elapsed:.1f}s" if final else ''))
+
+    def tripped():
+        return max_failures is not None and consecutive_failures >= max_failures
+
+    async def worker():
+        nonlocal last_report, consecutive_failures
+        while not tripped() and (item := await next_item()) is not _END:
+            try:
+                ok = await action(item)
+            except Exception as e:
+                logging.error(f"{label}: failed on {item!r}: {e}")
+                ok = False
+            counts[ok is False] += 1
+            if ok is False:
+                consecutive_failures += 1
+            elif ok:
+                consecutive_failures = 0
+            now = time.monotonic()
+            if now - last_report >= report_interval:
+                last_report = now
+                report()
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(max(1, concurrency))]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # If one worker failed (e.g. the item stream broke), stop the others before the caller cleans up
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    report(final=True)
+    if tripped():
+        raise TooManyFailures(f"{label}: stopped after {consecutive_failures} failures in a row")
+    return counts[0], counts[1]
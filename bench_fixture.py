@@ -0,0 +1,110 @@
+"""
+Seeded Postgres fixture for the cleanup benchmarks.
+
+Creates reservation.booking and the building tables clean_bookings_from_building.py
+joins through, in the database named by BENCH_DSN, and fills them with
+generate_series: bookings 1..N (matching the persons served by
+assaabloy/fake_server.py), about 30% of them in a delete status, spread over
+BENCH-0001.. buildings with dates around now.
+
+The tables are only (re)created in a database that has none of them yet or
+one this fixture created (marked by public.bench_fixture), so it cannot wipe
+a real database by accident.
+
+Usage: BENCH_DSN=postgresql://localhost/bench python bench_fixture.py [bookings] [buildings]
+"""
+import asyncio
+import os
+import sys
+import time
+
+import asyncpg
+
+# Dropped and recreated by SCHEMA
+TABLES = ('reservation.object_in_building_booking', 'reservation.booking',
+          'building.object_in_building', 'building.building')
+
+SCHEMA = f"""
+DROP TABLE IF EXISTS {', '.join(TABLES)};
+CREATE SCHEMA IF NOT EXISTS reservation;
+CREATE SCHEMA IF NOT EXISTS building;
+CREATE TABLE IF NOT EXISTS public.bench_fixture (created timestamptz NOT NULL DEFAULT now());
+CREATE TABLE building.building (id int PRIMARY KEY, code text NOT NULL UNIQUE);
+CREATE TABLE building.object_in_building (id int PRIMARY KEY, building_id int NOT NULL REFERENCES building.building);
+CREATE TABLE reservation.booking (
+    id bigint PRIMARY KEY,
+    booking_no text NOT NULL,
+    status text NOT NULL,
+    date_from timestamptz NOT NULL,
+    date_to timestamptz NOT NULL,
+    is_deleted boolean NOT NULL DEFAULT false
+);
+CREATE TABLE reservation.object_in_building_booking (
+    booking_id bigint NOT NULL REFERENCES reservation.booking,
+    object_in_building_id int NOT NULL REFERENCES building.object_in_building
+);
+"""
+
+# (statement, uses bookings, uses buildings)
+SEED = [
+    ("""
+INSERT INTO building.building
+SELECT b, 'BENCH-' || lpad(b::text, 4, '0') FROM generate_series(1, $1::int) b
+""", False, True),
+    ("""
+INSERT INTO building.object_in_building
+SELECT o, (o - 1) / 10 + 1 FROM generate_series(1, $1::int * 10) o
+""", False, True),
+    ("""
+INSERT INTO reservation.booking (id, booking_no, status, date_from, date_to)
+SELECT i, 'BN' || i,
+       (ARRAY['OPEN', 'CONFIRMED', 'CLOSED', 'OPEN', 'TO_BE_CLOSED', 'CONFIRMED', 'TO_BE_CANCELLED',
+              'OPEN', 'CONFIRMED', 'CANCELLED'])[i % 10 + 1],
+       now() + ((i % 14) - 3) * interval '1 day',
+       now() + ((i % 14) - 1) * interval '1 day'
+FROM generate_series(1, $1::bigint) i
+""", True, False),
+    ("""
+INSERT INTO reservation.object_in_building_booking
+SELECT i, (i % ($2::int * 10)) + 1 FROM generate_series(1, $1::bigint) i
+""", True, True),
+    ("""
+ANALYZE building.building, building.object_in_building, reservation.booking,
+    reservation.object_in_building_booking
+""", False, False),
+]
+
+
+def building_codes(buildings):
+    return [f"BENCH-{b:04d}" for b in range(1, buildings + 1)]
+
+
+async def seed(dsn, bookings, buildings=20):
+    conn = await asyncpg.connect(dsn)
+    try:
+        existing = [table for table in TABLES if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", table)]
+        is_fixture = await conn.fetchval("SELECT to_regclass('public.bench_fixture') IS NOT NULL")
+        if existing and not is_fixture:
+            raise RuntimeError(f"tables not created by bench_fixture.py already exist ({', '.join(existing)}); "
+                               "point BENCH_DSN at a scratch database")
+        start = time.perf_counter()
+        async with conn.transaction():
+            await conn.execute(SCHEMA)
+            for statement, uses_bookings, uses_buildings in SEED:
+                args = [bookings] * uses_bookings + [buildings] * uses_buildings
+                await conn.execute(statement, *args)
+        return time.perf_counter() - start
+    finally:
+        await conn.close()
+
+
+def main():
+    args = sys.argv[1:]
+    bookings = int(args[0]) if args else 10000
+    buildings = int(args[1]) if len(args) > 1 else 20
+    seconds = asyncio.run(seed(os.environ['BENCH_DSN'], bookings, buildings))
+    print(f"Seeded {bookings} bookings in {buildings} buildings in {seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Memory benchmark for holding AA persons and credentials.
+
+Builds PersonList/CredentialList response bodies shaped like the AA API and
+finds the orphaned credentials two ways:
+
+  dicts    json.loads of each body, kept as lists of dicts (the original
+           clean_aa_persons.py), joined with a set of person IDs
+  stream   what clean_aa_persons.clean() does: persons streamed through
+           json_stream into an IdColumn of their IDs, then credentials
+           streamed and checked against its index one at a time
+
+Reports the memory still held once the persons are loaded (tracemalloc),
+the peak over the whole run, and the load and join times; the stream join
+includes parsing the credential body, which dicts does while loading.
+
+Usage: python bench_persons.py [persons]
+"""
+import json
+import sys
+import time
+import tracemalloc
+
+from assaabloy.compact import IdColumn
+from assaabloy.json_stream import ListStreamParser
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_bodies(count):
+    persons = [{"ID": 100000 + i, "Name": f"Guest_{i % 977}_{500000 + i}", "Type": 1, "ValidFrom":
+                "2026-01-01T00:00:00", "ValidTo": "2026-12-31T23:59:59", "Department": "", "Disabled": False}
+               for i in range(count)]
+    # About 1.2 credentials per person, 5% of them orphaned
+    credentials = [{"ID": 900000 + i, "PrsId": 100000 + (i * 5 // 6) + (count if i % 20 == 0 else 0),
+                    "Card": f"{i:016X}", "Type": 2} for i in range(count * 6 // 5)]
+    return (json.dumps({"PersonList": persons}).encode(), json.dumps({"CredentialList": credentials}).encode())
+
+
+def chunks(body):
+    return (body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+
+
+def load_dicts(person_body, credential_body):
+    return json.loads(person_body)["PersonList"], json.loads(credential_body)["CredentialList"]
+
+
+def join_dicts(persons, credentials):
+    person_ids = {person['ID'] for person in persons}
+    return [credential for credential in credentials if credential['PrsId'] not in person_ids]
+
+
+def stream_records(body, key):
+    parser = ListStreamParser(key)
+    for chunk in chunks(body):
+        yield from parser.feed(chunk.decode('utf-8'))  # ASCII bodies, so chunks split cleanly
+    yield from parser.close()
+
+
+def load_stream(person_body, credential_body):
+    person_ids = IdColumn()
+    for person in stream_records(person_body, "PersonList"):
+        person_ids.append(person['ID'])
+    return person_ids, credential_body
+
+
+def join_stream(person_ids, credential_body):
+    person_index = person_ids.index()
+    return [credential['ID'] for credential in stream_records(credential_body, "CredentialList")
+            if credential['PrsId'] not in person_index]
+
+
+def measure(name, load, join):
+    tracemalloc.start()
+    start = time.perf_counter()
+    loaded = load()
+    load_seconds = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0]
+
+    start = time.perf_counter()
+    orphans = join(*loaded)
+    join_seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{name:<8} held {held / 1048576:>8.1f} MiB  peak {peak / 1048576:>8.1f} MiB  "
+          f"load {load_seconds:>6.2f}s  join {join_seconds:>6.3f}s  orphans {len(orphans)}")
+    return held
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    count = int(args[0]) if args else 200_000
+    person_body, credential_body = make_bodies(count)
+    print(f"{count} persons, {count * 6 // 5} credentials, "
+          f"{(len(person_body) + len(credential_body)) / 1048576:.1f} MiB of JSON")
+
+    before = measure("dicts", lambda: load_dicts(person_body, credential_body), join_dicts)
+    after = measure("stream", lambda: load_stream(person_body, credential_body), join_stream)
+    print(f"held memory: {before / max(after, 1):.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Microbenchmark for the pgoutput decoder.
+
+Compares pgoutput.decode_pgoutput_message against the previous slice-based
+decoder from track_db.py (kept below as legacy_decode, with its print calls
+replaced by a no-op so only parsing is measured). Note the legacy decoder
+never reached the new tuple of UPDATEs carrying a key tuple, so it does less
+work than the new one on a mixed workload; the default workload is therefore
+INSERT only. Reports messages per second.
+
+With --workers=N it also compares inline batch decoding (plus building the
+row dicts, which stays on track_db's main thread) against the multi-process
+DecodePipeline used by track_db.py (DECODE_WORKERS). As the measured rate
+depends on the cores available, it also reports the CPU per message of this
+process and of a worker, and projects the rate with one core per worker
+from them: this process is the ceiling however many workers run.
+
+Usage: python bench_pgoutput.py [messages] [columns] [--mixed] [--workers=N]
+"""
+import os
+import pickle
+import struct
+import sys
+import threading
+import time
+
+from pgoutput import Change, decode_pgoutput_message
+from pipeline import DecodePipeline, decode_batch
+from synthetic import build_delete, build_insert, build_update
+
+
+def _emit(*args):
+    pass
+
+
+# The decoder as it was in track_db.py, minus printing
+def legacy_decode(payload, relation_map):
+    message_type = payload[0:1].decode('ascii')
+    if message_type in ('I', 'U', 'D'):
+        relation_id, = struct.unpack('!I', payload[1:5])
+        relation_info = relation_map.get(relation_id, None)
+        columns = relation_info['columns'] if relation_info else []
+        rest = payload[5:]
+        if message_type == 'U' and rest[0:1].decode('ascii') == 'K':
+            rest = rest[1:]
+        if rest[0:1].decode('ascii') in ('N', 'K'):
+            column_count = struct.unpack('!H', rest[1:3])[0]
+            offset = 3
+            for col_idx in range(column_count):
+                isnull = rest[offset:offset + 1]
+                col_name = columns[col_idx] if col_idx < len(columns) else f"unnamed_col_{col_idx + 1}"
+                if isnull == b't':
+                    offset += 1
+                    col_len = struct.unpack('!I', rest[offset:offset + 4])[0]
+                    offset += 4
+                    col_value = rest[offset:offset + col_len].decode('utf-8')
+                    offset += col_len
+                    _emit(f"{col_name}: {col_value}")
+                else:
+                    offset += 1
+                    _emit(f"{col_name}: NULL")
+
+
+def make_workload(count, columns, mixed=False):
+    """INSERT workload over a single relation, or a mixed INSERT/UPDATE/DELETE one."""
+    messages = []
+    for i in range(count):
+        values = [None if c % 7 == 3 else f"value-{i}-{c}" for c in range(columns)]
+        kind = i % 3 if mixed else 0
+        if kind == 0:
+            messages.append(build_insert(16384, values))
+        elif kind == 1:
+            messages.append(build_update(16384, [str(i)], values))
+        else:
+            messages.append(build_delete(16384, [str(i)]))
+    return messages
+
+
+def run(label, fn, messages):
+    start = time.perf_counter()
+    for payload in messages:
+        fn(payload)
+    elapsed = time.perf_counter() - start
+    rate = len(messages) / elapsed
+    print(f"{label:<28} {rate:>12,.0f} msg/s  ({elapsed:.3f}s)")
+    return rate
+
+
+def build_rows(messages, columns):
+    """The main thread's share of track_db's work per message: a row dict per change."""
+    for message in messages:
+        if isinstance(message, Change):
+            dict(zip(columns, message.new if message.new is not None else message.old))
+
+
+def run_pipeline(messages, workers, columns, batch_size=500):
+    batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+
+    start, cpu = time.perf_counter(), time.process_time()
+    for batch in batches:
+        build_rows(decode_batch(batch), columns)
+    inline = len(messages) / (time.perf_counter() - start)
+    inline_cpu = (time.process_time() - cpu) / len(messages)
+    print(f"{'inline decode + rows':<28} {inline:>12,.0f} msg/s")
+
+    # What a worker does per message: unpickle the payloads, decode, pickle the records
+    start = time.process_time()
+    for batch in batches:
+        pickle.dumps(decode_batch(pickle.loads(pickle.dumps(batch))))
+    worker_cpu = (time.process_time() - start) / len(messages)
+
+    pipeline = DecodePipeline(workers)
+    # Warm up the worker processes so spawn time is not measured
+    pipeline.executor.submit(decode_batch, batches[0]).result()
+    start, cpu = time.perf_counter(), time.process_time()
+
+    def produce():
+        for batch in batches:
+            pipeline.submit(batch, range(len(batch)))
+        pipeline.finish()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    count = 0
+    for message, _ in pipeline.results():
+        build_rows((message,), columns)
+        count += 1
+    rate = count / (time.perf_counter() - start)
+    # CPU of every thread in this process (reader, result handling, executor feeder); the
+    # workers run in their own processes, so on enough cores this is the part that limits
+    parent_cpu = (time.process_time() - cpu) / count
+    producer.join()
+    pipeline.close()
+    print(f"{f'pipeline ({workers} workers)':<28} {rate:>12,.0f} msg/s  speedup {rate / inline:.2f}x"
+          f" on {os.cpu_count()} cores")
+
+    # Projection for one core per worker plus one for this process
+    def projected(n):
+        return 1 / max(parent_cpu, worker_cpu / n)
+    crossover = next((n for n in range(1, 65) if projected(n) > inline), None)
+    print(f"cpu per message: inline {inline_cpu * 1e6:.1f} us, pipeline parent {parent_cpu * 1e6:.1f} us"
+          f" + worker {worker_cpu * 1e6:.1f} us")
+    print(f"projected with {workers}+1 cores {projected(workers):>9,.0f} msg/s"
+          f" ({projected(workers) / inline:.2f}x), at most {1 / parent_cpu / inline:.2f}x;"
+          f" faster than inline from {crossover or 'no'} workers")
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    mixed = '--mixed' in sys.argv
+    workers = next((int(a.split('=')[1]) for a in sys.argv if a.startswith('--workers=')), 0)
+    count = int(args[0]) if len(args) > 0 else 200_000
+    columns = int(args[1]) if len(args) > 1 else 20
+    relation_map = {16384: {'table_name': 'public.bench', 'columns': [f"c{i}" for i in range(columns)]}}
+    messages = make_workload(count, columns, mixed)
+    print(f"{count} {'mixed' if mixed else 'INSERT'} messages, {columns} columns")
+
+    legacy = run("legacy (decode all)", lambda p: legacy_decode(p, relation_map), messages)
+    run("pgoutput (lazy, no access)", decode_pgoutput_message, messages)
+
+    def decode_all(payload):
+        change = decode_pgoutput_message(payload)
+        (change.new if change.new is not None else change.old).values()
+
+    def decode_two(payload):
+        change = decode_pgoutput_message(payload)
+        values = change.new if change.new is not None else change.old
+        values[0]
+        values[len(values) - 1]
+
+    new = run("pgoutput (decode all)", decode_all, messages)
+    two = run("pgoutput (first+last col)", decode_two, messages)
+    print(f"speedup vs legacy: decode all {new / legacy:.2f}x, two columns {two / legacy:.2f}x")
+
+    if workers:
+        run_pipeline(messages, workers, relation_map[16384]['columns'])
+
+
+if __name__ == "__main__":
+    main()
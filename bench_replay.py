@@ -0,0 +1,88 @@
+"""
+Benchmark suite for the decode/apply path, driven by synthetic capture files.
+
+For every workload in synthetic.WORKLOADS a capture file is written to a
+temporary directory and replayed through track_db's decoder and a null sink
+(audit records are still serialized). Reports messages/s and rows/s, then
+replays a slice of the capture again under tracemalloc. CPython exposes no
+allocation counter, so per message the growth of the traced peak while it
+is handled stands in for the bytes it allocates (a lower bound: memory freed
+and allocated again within the message counts once). Also reported are the
+traced peak of the pass and the bytes still held per message at its end.
+
+Usage: python bench_replay.py [workload ...] [--scale=0.2]
+"""
+import inspect
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import islice
+
+from capture import read_capture, write_capture
+from replay import replay, reset_state
+from sinks import BatchingSink, NullWriter
+from synthetic import WORKLOADS
+
+ALLOCATION_SAMPLE = 20000
+
+
+def traced_allocations(records, stats):
+    """Yield records, adding the traced peak growth while each is handled to stats['allocated']."""
+    for record in records:
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        yield record
+        peak = tracemalloc.get_traced_memory()[1]
+        stats['allocated'] += peak - start
+        stats['peak'] = max(stats['peak'], peak)
+
+
+def run_workload(name, generator, scale, directory):
+    path = os.path.join(directory, f"{name}.cap")
+    transactions = inspect.signature(generator).parameters['transactions'].default
+    records = write_capture(path, generator(transactions=max(1, int(transactions * scale))))
+
+    rows = []
+    sink = BatchingSink(NullWriter(), lambda lsn: None, max_rows=5000, max_delay_ms=60000)
+    write_batch = sink.writer.write_batch
+
+    def counting_write(transactions):
+        rows.append(sum(len(txn.rows) for txn in transactions))
+        write_batch(transactions)
+
+    sink.writer.write_batch = counting_write
+
+    reset_state()
+    start = time.perf_counter()
+    count = replay(read_capture(path), sink)
+    elapsed = time.perf_counter() - start
+
+    reset_state()
+    sample_sink = BatchingSink(NullWriter(), lambda lsn: None, max_rows=5000, max_delay_ms=60000)
+    sample = list(islice(read_capture(path), ALLOCATION_SAMPLE))
+    stats = {'allocated': 0, 'peak': 0}
+    tracemalloc.start()
+    sampled = replay(traced_allocations(sample, stats), sample_sink)
+    current, peak = tracemalloc.get_traced_memory()  # the peak since the last message, e.g. the final flush
+    peak = max(peak, stats['peak'])
+    tracemalloc.stop()
+
+    size = os.path.getsize(path)
+    print(f"{name:<20} {records:>9} msg {size / 1048576:>7.1f} MiB  "
+          f"{count / elapsed:>10,.0f} msg/s {sum(rows) / elapsed:>10,.0f} rows/s  "
+          f"alloc {stats['allocated'] / sampled:>7.1f} B/msg  peak {peak / 1024:>8.0f} KiB  "
+          f"held {current / sampled:>6.1f} B/msg")
+
+
+def main():
+    names = [a for a in sys.argv[1:] if not a.startswith('--')] or list(WORKLOADS)
+    scale = next((float(a.split('=', 1)[1]) for a in sys.argv if a.startswith('--scale=')), 1.0)
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            run_workload(name, WORKLOADS[name], scale, directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Capture files: raw replication payloads with their LSNs.
+
+Layout: the MAGIC header, then one record per message,
+
+    data_start LSN (uint64) | payload length (uint32) | payload bytes
+
+all big-endian. Recording is a buffered append per message; reading walks
+large chunks with unpack_from and hands out payload slices.
+"""
+import struct
+
+MAGIC = b'PGOUTCAP1\n'
+RECORD_HEADER = struct.Struct('!QI')
+
+
+class CaptureWriter:
+    """Append (lsn, payload) records to a capture file."""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb', buffering=1024 * 1024)
+        self.file.write(MAGIC)
+        self.count = 0
+
+    def write(self, lsn, payload):
+        self.file.write(RECORD_HEADER.pack(lsn, len(payload)))
+        self.file.write(payload)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+def write_capture(path, records):
+    """Write an iterable of (lsn, payload) pairs. Returns the number of records."""
+    writer = CaptureWriter(path)
+    try:
+        for lsn, payload in records:
+            writer.write(lsn, payload)
+    finally:
+        writer.close()
+    return writer.count
+
+
+def read_capture(path, chunk_size=4 * 1024 * 1024):
+    """Yield (lsn, payload) pairs from a capture file."""
+    header_size = RECORD_HEADER.size
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        buf = b''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            buf = buf + chunk if buf else chunk
+            pos = 0
+            end = len(buf)
+            while pos + header_size <= end:
+                lsn, length = RECORD_HEADER.unpack_from(buf, pos)
+                if pos + header_size + length > end:
+                    break
+                start = pos + header_size
+                yield lsn, buf[start:start + length]
+                pos = start + length
+            buf = buf[pos:]
+        if buf:
+            raise ValueError(f"{path} ends with a truncated record")
@@ -1,88 +1,209 @@
 import asyncio
 import os
+import sys
+import time
 
-import asyncpg
-from dotenv import load_dotenv
-load_dotenv()
-# Define database connection parameters
-conn_params = {
-    'database': os.getenv('DB_NAME'),
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'host': os.getenv('DB_HOST'),
-    'port': os.getenv('DB_PORT'),
-}
+from resources import get_pool, load_env, run
+load_env()
+
+# Buildings to sweep (comma separated, or as command line arguments) and the booking window
+BUILDING_CODES = [code.strip() for code in os.getenv('BUILDING_CODES', 'DE-10178-A').split(',') if code.strip()]
+WINDOW_DAYS = int(os.getenv('WINDOW_DAYS', '7'))
+
+# How to soft delete: 'row' (one UPDATE per booking), 'chunked' (UPDATE ... WHERE id = ANY($1) per
+# chunk of IDs) or 'set' (one UPDATE ... FROM the selection query, without fetching the IDs)
+DELETE_MODE = os.getenv('DELETE_MODE', 'chunked')
+DELETE_CHUNK_SIZE = int(os.getenv('DELETE_CHUNK_SIZE', '1000'))
+CHUNKS_PER_TRANSACTION = int(os.getenv('CHUNKS_PER_TRANSACTION', '1'))  # 0 = one transaction per worker
+
+# Concurrency: buildings swept at once, and delete workers per building. Each building in
+# flight holds one connection for its cursor plus one per worker; the pool is grown to fit.
+BUILDING_CONCURRENCY = int(os.getenv('BUILDING_CONCURRENCY', '2'))
+PER_BUILDING_CONCURRENCY = int(os.getenv('PER_BUILDING_CONCURRENCY', '3'))
+POOL_SIZE = int(os.getenv('POOL_SIZE', '10'))
 
 # Define the queries
 SELECT_BOOKINGS_QUERY = """
 SELECT booking.id
 FROM reservation.booking
-JOIN reservation.object_in_building_booking 
+JOIN reservation.object_in_building_booking
     ON booking.id = object_in_building_booking.booking_id
-JOIN building.object_in_building 
+JOIN building.object_in_building
     ON object_in_building_booking.object_in_building_id = object_in_building.id
-JOIN building.building 
+JOIN building.building
     ON object_in_building.building_id = building.id
-WHERE building.code = 'DE-10178-A'
+WHERE building.code = $1
   AND booking.date_to >= NOW() -- Booking ends after now
-  AND booking.date_from <= NOW() + INTERVAL '7 days' -- Booking starts by next week
-  AND booking.is_deleted = false;
+  AND booking.date_from <= NOW() + make_interval(days => $2::int) -- Booking starts within the window
+  AND booking.is_deleted = false
 """
 
 SOFT_DELETE_QUERY = """
-UPDATE reservation.booking 
-SET is_deleted = TRUE 
+UPDATE reservation.booking
+SET is_deleted = TRUE
 WHERE id = $1;
 """
 
-async def get_bookings_to_delete(pool):
-    """ Fetch all the bookings that are due for soft deletion. Returns a list of bookings """
+BULK_SOFT_DELETE_QUERY = """
+WITH deleted AS (
+    UPDATE reservation.booking
+    SET is_deleted = TRUE
+    WHERE id = ANY($1) AND is_deleted = false
+    RETURNING id
+)
+SELECT count(*) FROM deleted;
+"""
+
+SET_SOFT_DELETE_QUERY = f"""
+WITH deleted AS (
+    UPDATE reservation.booking
+    SET is_deleted = TRUE
+    FROM ({SELECT_BOOKINGS_QUERY}) AS selected
+    WHERE reservation.booking.id = selected.id
+    RETURNING reservation.booking.id
+)
+SELECT count(*) FROM deleted;
+"""
+
+async def iter_booking_id_batches(pool, building_code, window_days, batch_size=DELETE_CHUNK_SIZE):
+    """ Stream the IDs of bookings due for soft deletion from a server-side cursor, in lists of batch_size """
     async with pool.acquire() as conn:
-        return await conn.fetch(SELECT_BOOKINGS_QUERY)  # Fetch rows as list of records (dict-like)
+        async with conn.transaction():  # cursors only live inside a transaction
+            cursor = await conn.cursor(SELECT_BOOKINGS_QUERY, building_code, window_days)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    return
+                yield [row['id'] for row in rows]
 
 async def soft_delete_booking(booking_id, pool, semaphore):
     """ Soft delete a booking given the booking ID, within a semaphore lock to limit concurrency """
-    async with semaphore:  # This will block when more than 5 tasks are active
+    async with semaphore:  # This will block when the building's worker limit is reached
         try:
             async with pool.acquire() as conn:  # Acquiring a connection for this task
-                await conn.execute(SOFT_DELETE_QUERY, booking_id)
+                status = await conn.execute(SOFT_DELETE_QUERY, booking_id)
                 print(f"Soft deleted booking with id: {booking_id}")
+                return int(status.split()[-1])  # "UPDATE <rows>"
         except Exception as e:
             print(f"Failed to soft delete booking with id={booking_id}: {e}")
+            return 0
+
+async def soft_delete_chunks(batches, pool, label, workers=PER_BUILDING_CONCURRENCY,
+                             chunks_per_transaction=CHUNKS_PER_TRANSACTION):
+    """
+    Soft delete chunks of booking IDs from an async iterator with set-based updates. Each worker
+    holds a connection and commits after chunks_per_transaction chunks. Returns the number of rows updated
+    """
+    lock = asyncio.Lock()  # the batch iterator is shared by all workers
+    exhausted = False
+    totals = {'chunks': 0, 'deleted': 0}
+
+    async def next_chunk():
+        nonlocal exhausted
+        async with lock:
+            if exhausted:
+                return None
+            chunk = await anext(batches, None)
+            exhausted = chunk is None
+            return chunk
+
+    async def worker():
+        async with pool.acquire() as conn:
+            statement = await conn.prepare(BULK_SOFT_DELETE_QUERY)
+            while not exhausted:
+                async with conn.transaction():
+                    done = 0
+                    while not chunks_per_transaction or done < chunks_per_transaction:
+                        chunk = await next_chunk()
+                        if chunk is None:
+                            break
+                        start = time.perf_counter()
+                        count = await statement.fetchval(chunk)
+                        done += 1
+                        totals['chunks'] += 1
+                        totals['deleted'] += count
+                        print(f"{label} chunk {totals['chunks']}: soft deleted {count} of {len(chunk)} bookings "
+                              f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(max(1, workers))]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # On a failure stop the other workers before the caller closes the batch iterator
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return totals['deleted']
+
+async def soft_delete_selected(pool, building_code, window_days):
+    """ Soft delete everything the selection query matches in a single statement. Returns the row count """
+    async with pool.acquire() as conn:
+        start = time.perf_counter()
+        deleted = await conn.fetchval(SET_SOFT_DELETE_QUERY, building_code, window_days)
+        print(f"{building_code}: soft deleted {deleted} bookings in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return deleted
+
+async def sweep_building(building_code, pool, window_days=WINDOW_DAYS):
+    """ Soft delete the due bookings of one building. Returns the number of rows updated """
+    start = time.perf_counter()
+    if DELETE_MODE == 'set':
+        deleted = await soft_delete_selected(pool, building_code, window_days)
+    elif DELETE_MODE == 'chunked':
+        batches = iter_booking_id_batches(pool, building_code, window_days)
+        try:
+            deleted = await soft_delete_chunks(batches, pool, building_code)
+        finally:
+            await batches.aclose()
+    else:
+        semaphore = asyncio.Semaphore(PER_BUILDING_CONCURRENCY)
+        deleted = 0
+        async for batch in iter_booking_id_batches(pool, building_code, window_days):
+            counts = await asyncio.gather(*(soft_delete_booking(booking_id, pool, semaphore) for booking_id in batch))
+            deleted += sum(counts)
+
+    print(f"{building_code}: soft deleted {deleted} bookings in {time.perf_counter() - start:.2f} s")
+    return deleted
 
 async def main():
-    conn_pool = None
     try:
-        # Step 1: Create a database connection pool
-        conn_pool = await asyncpg.create_pool(**conn_params)
+        building_codes = [arg for arg in sys.argv[1:] if not arg.startswith('--')] or BUILDING_CODES
 
-        # Step 2: Fetch all bookings that need to be soft deleted
-        bookings = await get_bookings_to_delete(conn_pool)
-        if not bookings:
-            print("No bookings found for soft deletion.")
-            return
+        # Step 1: Get the shared database connection pool (resources.run() closes it)
+        pool_size = max(POOL_SIZE, BUILDING_CONCURRENCY * (1 + PER_BUILDING_CONCURRENCY))
+        conn_pool = await get_pool(min_size=1, max_size=pool_size)
 
-        print(f"Found {len(bookings)} bookings for soft deletion.")
+        # Step 2: Sweep the buildings, BUILDING_CONCURRENCY at a time. IDs are streamed
+        # from a cursor per building and soft deleted as they arrive.
+        semaphore = asyncio.Semaphore(BUILDING_CONCURRENCY)
 
-        # Step 3: Create a semaphore to limit concurrency to 5 tasks
-        semaphore = asyncio.Semaphore(5)
+        failed = []
 
-        # Step 4: Create tasks where each task soft deletes a booking within the semaphore
-        delete_tasks = [soft_delete_booking(booking['id'], conn_pool, semaphore) for booking in bookings]
+        async def sweep(building_code):
+            async with semaphore:
+                try:
+                    return await sweep_building(building_code, conn_pool)
+                except Exception as e:
+                    print(f"Failed to sweep building {building_code}: {e}")
+                    failed.append(building_code)
+                    return 0
 
-        # Use asyncio.gather to handle tasks concurrently with a concurrency limit
-        await asyncio.gather(*delete_tasks)
+        counts = await asyncio.gather(*(sweep(building_code) for building_code in building_codes))
+        if failed:
+            print(f"Soft deleted {sum(counts)} bookings; {len(failed)} of {len(building_codes)} buildings "
+                  f"failed: {', '.join(failed)}")
+            return 1
+        if not sum(counts):
+            print("No bookings found for soft deletion.")
+            return 0
 
-        print("All applicable bookings have been successfully soft deleted.")
+        print(f"All applicable bookings have been successfully soft deleted "
+              f"({sum(counts)} in {len(building_codes)} buildings).")
+        return 0
 
     except Exception as e:
         print(f"An error occurred: {e}")
-
-    finally:
-        # Close the connection pool only if it was created
-        if conn_pool:
-            await conn_pool.close()
+        return 1
 
 if __name__ == "__main__":
-    # Use asyncio.run to execute the main coroutine
-    asyncio.run(main())
+    # Run the main coroutine, then close the shared pool; non-zero exit if a building failed
+    sys.exit(run(main()))
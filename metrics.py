@@ -0,0 +1,207 @@
+"""
+Low-overhead instrumentation for the replication consumer.
+
+Collection is plain attribute/dict updates plus a bisect per histogram
+sample; formatting only happens when the metrics are scraped. They are
+exposed in the Prometheus text format, either over a local HTTP endpoint
+(serve_metrics) or as a node_exporter textfile (start_textfile_writer).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pgoutput import pg_timestamp_to_datetime
+
+# Seconds; tuned for per-message decode and per-batch sink latencies
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, help_text, label):
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{label},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{label}}} {self.sum}")
+        lines.append(f"{name}_count{{{label}}} {self.count}")
+        return lines
+
+
+class ReplicationMetrics:
+    """Counters and gauges for one replication consumer."""
+
+    def __init__(self, slot_name=''):
+        self.slot_name = slot_name
+        self.messages = 0
+        self.rows_by_table = {}
+        self.data_start = 0       # LSN of the last message received
+        self.wal_end = 0          # server WAL end reported with it
+        self.send_time = None     # server send time of the last message
+        self.commit_time = None   # commit timestamp (pg microseconds) of the last committed transaction
+        self.decode_seconds = Histogram()
+        self.sink_seconds = Histogram()
+        self.feedback = None      # FeedbackScheduler, read at scrape time
+        self._last_scrape = None  # (time, messages, rows_by_table) for the per-second gauges
+
+    def received(self, msg):
+        self.messages += 1
+        self.data_start = msg.data_start
+        self.wal_end = msg.wal_end
+        self.send_time = msg.send_time
+
+    def row(self, table_name):
+        self.rows_by_table[table_name] = self.rows_by_table.get(table_name, 0) + 1
+
+    def committed(self, commit_time):
+        self.commit_time = commit_time
+
+    def render(self):
+        now = time.time()
+        label = f'slot="{self.slot_name}"'
+        rows = dict(self.rows_by_table)
+        lines = [
+            "# HELP track_db_messages_total Replication messages received.",
+            "# TYPE track_db_messages_total counter",
+            f"track_db_messages_total{{{label}}} {self.messages}",
+            "# HELP track_db_rows_total Row changes decoded, by table.",
+            "# TYPE track_db_rows_total counter",
+        ]
+        lines += [f'track_db_rows_total{{{label},table="{table}"}} {count}' for table, count in rows.items()]
+
+        # Rates since the previous scrape, for people looking at the endpoint directly
+        if self._last_scrape is not None:
+            then, messages, previous_rows = self._last_scrape
+            elapsed = max(now - then, 1e-9)
+            lines += ["# TYPE track_db_messages_per_second gauge",
+                      f"track_db_messages_per_second{{{label}}} {(self.messages - messages) / elapsed:.3f}",
+                      "# TYPE track_db_rows_per_second gauge"]
+            lines += [f'track_db_rows_per_second{{{label},table="{table}"}} '
+                      f'{(count - previous_rows.get(table, 0)) / elapsed:.3f}' for table, count in rows.items()]
+        self._last_scrape = (now, self.messages, rows)
+
+        wal_end = self.wal_end
+        if self.feedback is not None:
+            cursor_wal_end = getattr(self.feedback.cursor, 'wal_end', 0) or 0
+            wal_end = max(wal_end, cursor_wal_end)
+        # A keepalive's WAL end is how far the server has sent, so one past the last
+        # data message means nothing is waiting; without a cursor only data counts
+        caught_up = wal_end <= self.data_start or (self.feedback is not None and cursor_wal_end > self.data_start)
+        applied = caught_up and (self.feedback is None or self.feedback.confirmed_lsn >= self.feedback.received_lsn)
+        lines += [
+            "# HELP track_db_lag_bytes Server WAL end minus the LSN of the last received message.",
+            "# TYPE track_db_lag_bytes gauge",
+            f"track_db_lag_bytes{{{label}}} {max(wal_end - self.data_start, 0)}",
+        ]
+        if self.feedback is not None:
+            lines += [
+                "# HELP track_db_unconfirmed_bytes Server WAL end minus the LSN confirmed by the sink.",
+                "# TYPE track_db_unconfirmed_bytes gauge",
+                f"track_db_unconfirmed_bytes{{{label}}} {max(wal_end - self.feedback.confirmed_lsn, 0)}",
+                "# HELP track_db_seconds_since_feedback Time since feedback was last sent to the server.",
+                "# TYPE track_db_seconds_since_feedback gauge",
+                f"track_db_seconds_since_feedback{{{label}}} {time.monotonic() - self.feedback.last_sent:.3f}",
+            ]
+        if self.send_time is not None:
+            send_time = self.send_time if self.send_time.tzinfo else self.send_time.astimezone()
+            lag = 0.0 if caught_up else (datetime.now(timezone.utc) - send_time).total_seconds()
+            lines += [
+                "# HELP track_db_lag_seconds Time since the server sent the last received message,"
+                " 0 once the server has nothing more to send.",
+                "# TYPE track_db_lag_seconds gauge",
+                f"track_db_lag_seconds{{{label}}} {lag:.3f}",
+            ]
+        if self.commit_time is not None:
+            commit_lag = 0.0 if applied else (
+                datetime.now(timezone.utc) - pg_timestamp_to_datetime(self.commit_time)).total_seconds()
+            lines += [
+                "# HELP track_db_commit_lag_seconds Time since the last applied transaction committed on the server,"
+                " 0 once everything sent has been applied.",
+                "# TYPE track_db_commit_lag_seconds gauge",
+                f"track_db_commit_lag_seconds{{{label}}} {commit_lag:.3f}",
+            ]
+        lines += self.decode_seconds.render("track_db_decode_seconds", "Time spent decoding row changes.", label)
+        if self.sink_seconds is not None:
+            lines += self.sink_seconds.render("track_db_sink_seconds", "Time spent writing sink batches.", label)
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsGroup:
+    """
+    The metrics of several slot consumers, rendered as one exposition with the
+    samples of each metric family together. The slots share one sink, so the
+    group keeps the sink histogram (labelled slot="all") in place of theirs.
+    """
+
+    def __init__(self, members):
+        self.members = members
+        self.sink_seconds = Histogram()
+        for metrics in members:
+            metrics.sink_seconds = None
+
+    def render(self):
+        families = {}  # name -> (HELP/TYPE lines, samples), in first-seen order
+        texts = [metrics.render() for metrics in self.members]
+        texts.append('\n'.join(self.sink_seconds.render(
+            "track_db_sink_seconds", "Time spent writing sink batches.", 'slot="all"')))
+        for text in texts:
+            family = None
+            for line in text.splitlines():
+                if line.startswith('# '):
+                    family = families.setdefault(line.split()[2], ([], []))
+                    if line not in family[0]:
+                        family[0].append(line)
+                elif line:
+                    family[1].append(line)
+        return ''.join('\n'.join(headers + samples) + '\n' for headers, samples in families.values())
+
+
+def serve_metrics(metrics, port, host='127.0.0.1'):
+    """Serve /metrics over HTTP from a daemon thread. Returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+def start_textfile_writer(metrics, path, interval=15):
+    """Rewrite a Prometheus textfile every interval seconds from a daemon thread."""
+
+    def write():
+        while True:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(metrics.render())
+            os.replace(tmp_path, path)  # atomic, so the collector never reads a partial file
+            time.sleep(interval)
+
+    threading.Thread(target=write, name='metrics-textfile', daemon=True).start()
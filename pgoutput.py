@@ -0,0 +1,431 @@
+"""
+Decoder for the pgoutput logical replication protocol.
+
+The decoder walks the raw payload in place using precompiled struct readers
+(unpack_from), so no intermediate slices or byte copies are made while
+parsing. Row images are returned as lazy TupleData objects that only
+remember where their block starts; nothing is allocated per column until a
+value is actually read. Raw column values are handed out as memoryviews.
+"""
+import struct
+from array import array
+from fnmatch import fnmatchcase
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+# Precompiled network byte order readers, always used with unpack_from
+UINT16 = struct.Struct('!H')
+UINT32 = struct.Struct('!I')
+BEGIN_BODY = struct.Struct('!QqI')    # final LSN, commit timestamp, xid
+COMMIT_BODY = struct.Struct('!BQQq')  # flags, commit LSN, end LSN, commit timestamp
+STREAM_ABORT_BODY = struct.Struct('!II')  # xid, subtransaction xid
+
+# Message type bytes
+BEGIN = ord('B')
+COMMIT = ord('C')
+INSERT = ord('I')
+UPDATE = ord('U')
+DELETE = ord('D')
+RELATION = ord('R')
+TYPE = ord('Y')
+STREAM_START = ord('S')
+STREAM_STOP = ord('E')
+STREAM_COMMIT = ord('c')
+STREAM_ABORT = ord('A')
+
+# Messages that carry the transaction xid after the type byte inside a streamed block
+XID_PREFIXED = frozenset(b'IUDRYTM')
+
+# Tuple markers
+KEY_TUPLE = ord('K')
+OLD_TUPLE = ord('O')
+NEW_TUPLE = ord('N')
+
+# Column kinds inside TupleData
+COL_NULL = ord('n')
+COL_UNCHANGED = ord('u')
+COL_BINARY = ord('b')
+
+# Offsets stored for columns that carry no value
+NULL_OFFSET = -1
+UNCHANGED_OFFSET = -2
+
+# Decoded row change: op is 'I', 'U' or 'D'; new/old are TupleData (or plain value
+# tuples once decoded, see pipeline.py) or None. xid is only set for changes of
+# streamed in-progress transactions (the subtransaction xid, if any).
+Change = namedtuple('Change', ['op', 'relation_id', 'new', 'old', 'xid'], defaults=[None])
+
+# Transaction boundaries; commit_time is in microseconds since 2000-01-01 UTC
+Begin = namedtuple('Begin', ['final_lsn', 'commit_time', 'xid'])
+Commit = namedtuple('Commit', ['commit_lsn', 'end_lsn', 'commit_time'])
+
+# Protocol v2 streaming of in-progress transactions
+StreamStart = namedtuple('StreamStart', ['xid', 'first_segment'])
+StreamStop = namedtuple('StreamStop', [])
+StreamCommit = namedtuple('StreamCommit', ['xid', 'commit_lsn', 'end_lsn', 'commit_time'])
+StreamAbort = namedtuple('StreamAbort', ['xid', 'subxid'])
+
+# Relation ('R') message: table layout as seen by the publisher.
+# columns, type_oids and key_columns are parallel tuples (key_columns holds booleans)
+Relation = namedtuple('Relation', ['relation_id', 'namespace', 'name', 'replica_identity',
+                                   'columns', 'type_oids', 'key_columns'])
+
+# Type ('Y') message: sent for user-defined types before the first Relation that uses them
+Type = namedtuple('Type', ['type_oid', 'namespace', 'name'])
+
+
+class _UnchangedToast:
+    """Placeholder for a TOASTed value the server did not send because it did not change."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'UNCHANGED_TOAST'
+
+    def __reduce__(self):
+        # Unpickle to the module singleton so identity checks keep working across processes
+        return 'UNCHANGED_TOAST'
+
+
+UNCHANGED_TOAST = _UnchangedToast()
+
+POSTGRES_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def pg_timestamp_to_datetime(microseconds):
+    return POSTGRES_EPOCH + timedelta(microseconds=microseconds)
+
+
+class TupleData:
+    """
+    Lazy view over a pgoutput TupleData block.
+
+    Construction only records where the block starts. Column offsets are
+    scanned on indexed access, only as far as the requested column, and kept
+    in a compact array so a later access resumes where the scan stopped;
+    values() decodes the whole row in one pass without building the offset
+    array.
+    """
+    __slots__ = ('buf', 'pos', '_offsets', '_scan_pos')
+
+    def __init__(self, buf, pos):
+        self.buf = buf
+        self.pos = pos
+        self._offsets = None
+        self._scan_pos = 0  # position of the first column not scanned yet
+
+    def __len__(self):
+        return UINT16.unpack_from(self.buf, self.pos)[0]
+
+    def __iter__(self):
+        return iter(self.values())
+
+    @property
+    def offsets(self):
+        """Value start offsets of every column (NULL_OFFSET / UNCHANGED_OFFSET for those without one)."""
+        count = len(self)
+        if count:
+            self._offset(count - 1)
+        elif self._offsets is None:
+            self._offsets = array('l')
+        return self._offsets
+
+    def _offset(self, i):
+        """Value start offset of column i, scanning the columns up to it if not done yet."""
+        offsets = self._offsets
+        if offsets is None:
+            offsets = self._offsets = array('l')
+            self._scan_pos = self.pos + 2
+        count = len(self)
+        if i < 0:
+            i += count
+        if not 0 <= i < count:
+            raise IndexError("column index out of range")
+        if i >= len(offsets):
+            buf = self.buf
+            unpack_len = UINT32.unpack_from
+            append = offsets.append
+            pos = self._scan_pos
+            for _ in range(i + 1 - len(offsets)):
+                kind = buf[pos]
+                pos += 1
+                if kind == COL_NULL:
+                    append(NULL_OFFSET)
+                elif kind == COL_UNCHANGED:
+                    append(UNCHANGED_OFFSET)
+                else:
+                    length, = unpack_len(buf, pos)
+                    pos += 4
+                    append(pos)
+                    pos += length
+            self._scan_pos = pos
+        return offsets[i]
+
+    def __getitem__(self, i):
+        offset = self._offset(i)
+        if offset < 0:
+            return None if offset == NULL_OFFSET else UNCHANGED_TOAST
+        buf = self.buf
+        length, = UINT32.unpack_from(buf, offset - 4)
+        if buf[offset - 5] == COL_BINARY:
+            return bytes(buf[offset:offset + length])
+        return buf[offset:offset + length].decode('utf-8')
+
+    def raw(self, i):
+        """Return the undecoded column value as a memoryview (None for NULL/unchanged)."""
+        offset = self._offset(i)
+        if offset < 0:
+            return None
+        length, = UINT32.unpack_from(self.buf, offset - 4)
+        return memoryview(self.buf)[offset:offset + length]
+
+    def is_null(self, i):
+        return self._offset(i) == NULL_OFFSET
+
+    def values(self, mask=None, decoders=None):
+        """
+        Decode every column in a single pass. Returns a tuple.
+        With a mask (one boolean per column) only the wanted columns are
+        decoded and returned; the others are skipped by their length.
+        decoders (one per column, see pgtypes.decoders_for) turn binary
+        format values into native types; without one they stay bytes.
+        """
+        if mask is not None or decoders is not None:
+            return self._masked_values(mask, decoders)
+        buf = self.buf
+        unpack_len = UINT32.unpack_from
+        pos = self.pos
+        column_count, = UINT16.unpack_from(buf, pos)
+        pos += 2
+        out = []
+        append = out.append
+        for _ in range(column_count):
+            kind = buf[pos]
+            pos += 1
+            if kind == COL_NULL:
+                append(None)
+            elif kind == COL_UNCHANGED:
+                append(UNCHANGED_TOAST)
+            else:
+                length, = unpack_len(buf, pos)
+                pos += 4
+                if kind == COL_BINARY:
+                    append(bytes(buf[pos:pos + length]))
+                else:
+                    append(buf[pos:pos + length].decode('utf-8'))
+                pos += length
+        return tuple(out)
+
+    def _masked_values(self, mask, decoders):
+        buf = self.buf
+        unpack_len = UINT32.unpack_from
+        pos = self.pos
+        column_count, = UINT16.unpack_from(buf, pos)
+        pos += 2
+        out = []
+        append = out.append
+        for i in range(column_count):
+            kind = buf[pos]
+            pos += 1
+            wanted = mask is None or i >= len(mask) or mask[i]
+            if kind == COL_NULL:
+                if wanted:
+                    append(None)
+            elif kind == COL_UNCHANGED:
+                if wanted:
+                    append(UNCHANGED_TOAST)
+            else:
+                length, = unpack_len(buf, pos)
+                pos += 4
+                if wanted:
+                    if kind == COL_BINARY:
+                        decoder = decoders[i] if decoders is not None and i < len(decoders) else None
+                        append(decoder(buf, pos, length) if decoder is not None else bytes(buf[pos:pos + length]))
+                    else:
+                        append(buf[pos:pos + length].decode('utf-8'))
+                pos += length
+        return tuple(out)
+
+    def as_dict(self, columns):
+        """Decode every column into a {name: value} dict using the given column names."""
+        values = self.values()
+        names = list(columns)
+        for i in range(len(names), len(values)):
+            names.append(f"unnamed_col_{i + 1}")
+        return dict(zip(names, values))
+
+    def __repr__(self):
+        return f"TupleData({self.values()!r})"
+
+
+def skip_tuple(buf, pos):
+    """Return the position right after the TupleData block starting at pos."""
+    unpack_len = UINT32.unpack_from
+    column_count, = UINT16.unpack_from(buf, pos)
+    pos += 2
+    for _ in range(column_count):
+        kind = buf[pos]
+        pos += 1
+        if kind != COL_NULL and kind != COL_UNCHANGED:
+            pos += 4 + unpack_len(buf, pos)[0]
+    return pos
+
+
+class RelationFilter:
+    """
+    Include/exclude lists for tables and columns.
+
+    Tables are matched as 'schema.table' and columns as 'schema.table.column',
+    both with shell-style wildcards. When include_columns has patterns for a
+    table, only the matching columns of that table are kept. The lists are
+    resolved per relation OID as Relation messages arrive: skipped holds the
+    OIDs whose changes are dropped right after the OID is read, and masks
+    the per-column keep flags for relations that lose some columns.
+    """
+
+    def __init__(self, include_tables=(), exclude_tables=(), include_columns=(), exclude_columns=()):
+        self.config = (tuple(include_tables), tuple(exclude_tables), tuple(include_columns), tuple(exclude_columns))
+        self.include_tables = list(include_tables)
+        self.exclude_tables = list(exclude_tables)
+        self.include_columns = [pattern.rsplit('.', 1) for pattern in include_columns]
+        self.exclude_columns = [pattern.rsplit('.', 1) for pattern in exclude_columns]
+        self.skipped = set()
+        self.masks = {}
+
+    def copy(self):
+        """Same lists, fresh per-relation state (for use from another thread)."""
+        return RelationFilter(*self.config)
+
+    def __bool__(self):
+        return bool(self.include_tables or self.exclude_tables or self.include_columns or self.exclude_columns)
+
+    def wants_table(self, table):
+        if self.include_tables and not any(fnmatchcase(table, p) for p in self.include_tables):
+            return False
+        return not any(fnmatchcase(table, p) for p in self.exclude_tables)
+
+    def column_mask(self, table, columns):
+        """Return a tuple of keep flags for the columns of table, or None to keep them all."""
+        includes = [column for table_pattern, column in self.include_columns if fnmatchcase(table, table_pattern)]
+        excludes = [column for table_pattern, column in self.exclude_columns if fnmatchcase(table, table_pattern)]
+        if not includes and not excludes:
+            return None
+        mask = tuple((not includes or any(fnmatchcase(c, p) for p in includes))
+                     and not any(fnmatchcase(c, p) for p in excludes) for c in columns)
+        return None if all(mask) else mask
+
+    def add_relation(self, relation):
+        """Resolve the lists for a (possibly changed) relation."""
+        table = f"{relation.namespace}.{relation.name}"
+        self.skipped.discard(relation.relation_id)
+        self.masks.pop(relation.relation_id, None)
+        if not self.wants_table(table):
+            self.skipped.add(relation.relation_id)
+            return
+        mask = self.column_mask(table, relation.columns)
+        if mask is not None:
+            self.masks[relation.relation_id] = mask
+
+
+def read_string(buf, pos):
+    """Read a null-terminated string. Returns (str, position after the terminator)."""
+    end = buf.index(0, pos)
+    return buf[pos:end].decode('utf-8'), end + 1
+
+
+def decode_relation(buf, pos):
+    """Decode the body of a Relation message starting at pos (the relation OID)."""
+    relation_id, = UINT32.unpack_from(buf, pos)
+    namespace, pos = read_string(buf, pos + 4)
+    name, pos = read_string(buf, pos)
+    replica_identity = chr(buf[pos])
+    column_count, = UINT16.unpack_from(buf, pos + 1)
+    pos += 3
+    columns = []
+    type_oids = []
+    key_columns = []
+    for _ in range(column_count):
+        flags = buf[pos]
+        column, pos = read_string(buf, pos + 1)
+        type_oid, = UINT32.unpack_from(buf, pos)
+        pos += 8  # type OID + atttypmod
+        columns.append(column)
+        type_oids.append(type_oid)
+        key_columns.append(bool(flags & 1))
+    # An empty namespace means pg_catalog
+    return Relation(relation_id, namespace or 'pg_catalog', name, replica_identity,
+                    tuple(columns), tuple(type_oids), tuple(key_columns))
+
+
+def decode_pgoutput_message(payload, skip_relations=None, in_stream=False):
+    """
+    Decode a single pgoutput message (the bytes of msg.payload).
+    Returns a Change record for INSERT/UPDATE/DELETE, a Begin/Commit record for
+    transaction boundaries, a Stream* record for protocol v2 streaming, a
+    Relation or Type record for schema messages and None for anything else,
+    including changes of relations in skip_relations.
+
+    in_stream must be True between Stream Start and Stream Stop: messages in
+    a streamed block carry the (sub)transaction xid right after the type byte.
+    """
+    buf = payload
+    message_type = buf[0]
+
+    if message_type == BEGIN:
+        return Begin(*BEGIN_BODY.unpack_from(buf, 1))
+
+    if message_type == COMMIT:
+        _, commit_lsn, end_lsn, commit_time = COMMIT_BODY.unpack_from(buf, 1)
+        return Commit(commit_lsn, end_lsn, commit_time)
+
+    xid = None
+    start = 1
+    if in_stream and message_type in XID_PREFIXED:
+        xid, = UINT32.unpack_from(buf, 1)
+        start = 5
+
+    if message_type == INSERT or message_type == UPDATE or message_type == DELETE:
+        relation_id, = UINT32.unpack_from(buf, start)
+        if skip_relations and relation_id in skip_relations:
+            return None
+        pos = start + 4
+
+        if message_type == INSERT:
+            # buf[pos] is always 'N' for inserts
+            return Change('I', relation_id, TupleData(buf, pos + 1), None, xid)
+
+        if message_type == UPDATE:
+            old = None
+            # Optional key ('K') or full old row ('O'), depending on REPLICA IDENTITY
+            if buf[pos] == KEY_TUPLE or buf[pos] == OLD_TUPLE:
+                old = TupleData(buf, pos + 1)
+                pos = skip_tuple(buf, pos + 1)
+            return Change('U', relation_id, TupleData(buf, pos + 1), old, xid)
+
+        # DELETE: buf[pos] is 'K' or 'O'
+        return Change('D', relation_id, None, TupleData(buf, pos + 1), xid)
+
+    if message_type == RELATION:
+        return decode_relation(buf, start)
+
+    if message_type == TYPE:
+        type_oid, = UINT32.unpack_from(buf, start)
+        namespace, pos = read_string(buf, start + 4)
+        name, _ = read_string(buf, pos)
+        return Type(type_oid, namespace or 'pg_catalog', name)
+
+    if message_type == STREAM_START:
+        xid, = UINT32.unpack_from(buf, 1)
+        return StreamStart(xid, buf[5] == 1)
+
+    if message_type == STREAM_STOP:
+        return StreamStop()
+
+    if message_type == STREAM_COMMIT:
+        xid, = UINT32.unpack_from(buf, 1)
+        _, commit_lsn, end_lsn, commit_time = COMMIT_BODY.unpack_from(buf, 5)
+        return StreamCommit(xid, commit_lsn, end_lsn, commit_time)
+
+    if message_type == STREAM_ABORT:
+        return StreamAbort(*STREAM_ABORT_BODY.unpack_from(buf, 1))
+
+    return None
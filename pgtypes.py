@@ -0,0 +1,176 @@
+"""
+Decoders for Postgres binary send/recv formats, keyed by type OID.
+
+Used when replication runs with the pgoutput 'binary' option: column values
+then arrive in their binary wire format and are turned straight into native
+Python values without a text round-trip. Every decoder is called as
+decoder(buf, pos, length) and reads the value in place with a precompiled
+struct where possible. User-defined types announced by Type messages (enums,
+domains over text) are decoded as UTF-8 text, which is what enum_send and the
+text types send; values that are not valid UTF-8 stay bytes. Other types
+without an entry, e.g. arrays, inet or interval, are returned as bytes.
+"""
+import struct
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from functools import lru_cache
+
+INT2 = struct.Struct('!h')
+INT4 = struct.Struct('!i')
+INT8 = struct.Struct('!q')
+UINT4 = struct.Struct('!I')
+FLOAT4 = struct.Struct('!f')
+FLOAT8 = struct.Struct('!d')
+NUMERIC_HEADER = struct.Struct('!hhHh')  # ndigits, weight, sign, dscale
+
+POSTGRES_EPOCH_DATE = date(2000, 1, 1)
+POSTGRES_EPOCH_NAIVE = datetime(2000, 1, 1)
+POSTGRES_EPOCH_UTC = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+NUMERIC_NEG = 0x4000
+NUMERIC_NAN = 0xC000
+NUMERIC_PINF = 0xD000
+NUMERIC_NINF = 0xF000
+
+
+def decode_bool(buf, pos, length):
+    return buf[pos] != 0
+
+
+def decode_int2(buf, pos, length):
+    return INT2.unpack_from(buf, pos)[0]
+
+
+def decode_int4(buf, pos, length):
+    return INT4.unpack_from(buf, pos)[0]
+
+
+def decode_int8(buf, pos, length):
+    return INT8.unpack_from(buf, pos)[0]
+
+
+def decode_oid(buf, pos, length):
+    return UINT4.unpack_from(buf, pos)[0]
+
+
+def decode_float4(buf, pos, length):
+    return FLOAT4.unpack_from(buf, pos)[0]
+
+
+def decode_float8(buf, pos, length):
+    return FLOAT8.unpack_from(buf, pos)[0]
+
+
+def decode_text(buf, pos, length):
+    return buf[pos:pos + length].decode('utf-8')
+
+
+def decode_bytea(buf, pos, length):
+    return bytes(buf[pos:pos + length])
+
+
+def decode_user_type(buf, pos, length):
+    value = buf[pos:pos + length]
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return bytes(value)
+
+
+def decode_jsonb(buf, pos, length):
+    # First byte is the jsonb format version (1), the rest is JSON text
+    return buf[pos + 1:pos + length].decode('utf-8')
+
+
+def decode_uuid(buf, pos, length):
+    return uuid.UUID(bytes=bytes(buf[pos:pos + 16]))
+
+
+def decode_date(buf, pos, length):
+    days = INT4.unpack_from(buf, pos)[0]
+    try:
+        return POSTGRES_EPOCH_DATE + timedelta(days=days)
+    except OverflowError:  # 'infinity' / '-infinity'
+        return 'infinity' if days > 0 else '-infinity'
+
+
+def decode_timestamp(buf, pos, length):
+    microseconds = INT8.unpack_from(buf, pos)[0]
+    try:
+        return POSTGRES_EPOCH_NAIVE + timedelta(microseconds=microseconds)
+    except OverflowError:
+        return 'infinity' if microseconds > 0 else '-infinity'
+
+
+def decode_timestamptz(buf, pos, length):
+    microseconds = INT8.unpack_from(buf, pos)[0]
+    try:
+        return POSTGRES_EPOCH_UTC + timedelta(microseconds=microseconds)
+    except OverflowError:
+        return 'infinity' if microseconds > 0 else '-infinity'
+
+
+def decode_time(buf, pos, length):
+    microseconds = INT8.unpack_from(buf, pos)[0]
+    seconds, microsecond = divmod(microseconds, 1000000)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    return time(hour, minute, second, microsecond)
+
+
+def decode_numeric(buf, pos, length):
+    ndigits, weight, sign, dscale = NUMERIC_HEADER.unpack_from(buf, pos)
+    if sign == NUMERIC_NAN:
+        return Decimal('NaN')
+    if sign == NUMERIC_PINF or sign == NUMERIC_NINF:
+        return Decimal('Infinity' if sign == NUMERIC_PINF else '-Infinity')
+    digits = struct.unpack_from(f"!{ndigits}h", buf, pos + 8)
+    # Base-10000 digits, weight is the exponent of the first one
+    value = 0
+    for digit in digits:
+        value = value * 10000 + digit
+    # Rescale to exactly dscale fractional digits (digits past it are zero padding)
+    shift = (weight - ndigits + 1) * 4 + dscale
+    if shift >= 0:
+        value *= 10 ** shift
+    else:
+        value //= 10 ** -shift
+    return Decimal((1 if sign == NUMERIC_NEG else 0, tuple(map(int, str(value))), -dscale))
+
+
+# Type OIDs from pg_type.dat
+BINARY_DECODERS = {
+    16: decode_bool,
+    17: decode_bytea,
+    18: decode_text,         # "char"
+    19: decode_text,         # name
+    20: decode_int8,
+    21: decode_int2,
+    23: decode_int4,
+    25: decode_text,
+    26: decode_oid,
+    114: decode_text,        # json
+    700: decode_float4,
+    701: decode_float8,
+    1042: decode_text,       # bpchar
+    1043: decode_text,       # varchar
+    1082: decode_date,
+    1083: decode_time,
+    1114: decode_timestamp,
+    1184: decode_timestamptz,
+    1700: decode_numeric,
+    2950: decode_uuid,
+    3802: decode_jsonb,
+}
+
+
+@lru_cache(maxsize=1024)
+def decoders_for(type_oids, user_type_oids=frozenset()):
+    """
+    Per-column decoder tuple for a relation's type OIDs. Unknown types get
+    decode_user_type if they are among user_type_oids (the OIDs announced by
+    Type messages), None otherwise.
+    """
+    return tuple(BINARY_DECODERS.get(type_oid, decode_user_type if type_oid in user_type_oids else None)
+                 for type_oid in type_oids)
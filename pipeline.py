@@ -0,0 +1,202 @@
+"""
+Pipelined, multi-core decoding of the replication stream.
+
+    reader thread  --(payload batches)-->  decoder processes  --(futures, FIFO)-->  main thread
+
+The reader thread is the only one touching the replication cursor: it reads
+raw payloads with their LSNs, batches them and sends the batches to a
+process pool, and it also sends the batched feedback. Futures are queued in
+submission order, so the main thread gets decoded messages back in exactly
+the order they were received (and therefore in transaction order) before
+passing them to the sink.
+"""
+import multiprocessing
+import queue
+import select
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pgtypes import decoders_for
+from pgoutput import (DELETE, INSERT, RELATION, STREAM_START, STREAM_STOP, TYPE, UINT32, UPDATE, Change,
+                      decode_pgoutput_message, decode_relation)
+
+
+def decode_batch(payloads, masks=None, in_stream=False, type_oids=None):
+    """
+    Decoder process entry point: decode a batch of payloads into picklable
+    records. Row images are turned into plain value tuples here, so the
+    per-column work happens in the worker; masks ({relation OID: column keep
+    flags}) drop unwanted columns without decoding them. in_stream tells
+    whether the batch starts inside a streamed transaction block. type_oids
+    ({relation OID: (column type OIDs, user-defined type OIDs among them)})
+    enables typed decoding of binary values.
+    """
+    out = []
+    for payload in payloads:
+        message_type = payload[0]
+        if message_type == STREAM_START:
+            in_stream = True
+        elif message_type == STREAM_STOP:
+            in_stream = False
+        message = decode_pgoutput_message(payload, in_stream=in_stream)
+        if isinstance(message, Change):
+            mask = masks.get(message.relation_id) if masks else None
+            types = type_oids.get(message.relation_id) if type_oids else None
+            decoders = decoders_for(*types) if types is not None else None
+            message = Change(message.op, message.relation_id,
+                             message.new.values(mask, decoders) if message.new is not None else None,
+                             message.old.values(mask, decoders) if message.old is not None else None,
+                             message.xid)
+        out.append(message)
+    return out
+
+
+def timed_decode_batch(*args):
+    """decode_batch that also reports how long the worker spent on it."""
+    start = time.perf_counter()
+    out = decode_batch(*args)
+    return time.perf_counter() - start, out
+
+
+class DecodePipeline:
+    """Process pool plus the ordered queue of in-flight batches."""
+
+    def __init__(self, workers, max_pending_batches=None):
+        # spawn: the parent runs a reader thread and holds an open replication socket
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        # Bounded so a slow sink applies backpressure on the reader
+        self.pending = queue.Queue(max_pending_batches or workers * 4)
+        self.finished = False
+
+    def submit(self, payloads, lsns, masks=None, in_stream=False, type_oids=None):
+        self.pending.put((self.executor.submit(timed_decode_batch, payloads, masks, in_stream, type_oids), lsns))
+
+    def finish(self):
+        """Signal that no more batches will be submitted."""
+        self.pending.put((None, None))
+
+    def results(self, on_idle=None, idle_timeout=0.5, on_batch=None):
+        """
+        Yield (message, lsn) pairs in stream order until finish() was called.
+        on_batch(seconds, count) is called with the worker decode time of every batch.
+        """
+        while True:
+            try:
+                future, lsns = self.pending.get(timeout=idle_timeout)
+            except queue.Empty:
+                if on_idle is not None:
+                    on_idle()
+                continue
+            if future is None:
+                self.finished = True
+                return
+            elapsed, messages = future.result()
+            if on_batch is not None and messages:
+                on_batch(elapsed, len(messages))
+            yield from zip(messages, lsns)
+
+    def drain(self):
+        """Discard queued batches until the reader has finished (used on shutdown)."""
+        while not self.finished:
+            future, _ = self.pending.get()
+            if future is None:
+                self.finished = True
+            else:
+                future.cancel()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def start_reader(cursor, pipeline, feedback, batch_size=500, relation_filter=None, binary=False, on_message=None,
+                 stop=None):
+    """
+    Start the reader thread. Partial batches are submitted as soon as the
+    stream goes idle so latency stays low at small volumes.
+
+    With a RelationFilter (owned by this thread) the reader resolves Relation
+    messages itself, drops changes of skipped relations before they are
+    batched and sends the current column masks along with every batch. A
+    batch is cut at each Relation message so masks always match the layout.
+    With binary=True it also sends the column type OIDs of every relation, and
+    which of them Type messages announced, so the decoder processes can decode
+    binary values into native types.
+    on_message(msg) is called on the reader thread for every raw message.
+    Returns (thread, stop_event), stop_event being `stop` if one was given; an
+    exception raised while reading is kept in thread.error after the results
+    have been drained.
+    """
+    stop = stop or threading.Event()
+
+    # Whether the stream is inside a Stream Start/Stop block: now, and where the open batch began
+    state = {'in_stream': False, 'batch_in_stream': False}
+    relation_types = {}
+    user_types = set()  # type OIDs announced by Type messages
+    track_relations = bool(relation_filter) or binary
+
+    def submit(payloads, lsns):
+        pipeline.submit(payloads, lsns, dict(relation_filter.masks) if relation_filter else None,
+                        state['batch_in_stream'], dict(relation_types) if binary else None)
+
+    def read():
+        payloads, lsns = [], []
+        try:
+            while not stop.is_set():
+                msg = cursor.read_message()
+                if msg is not None:
+                    feedback.received(msg.data_start)
+                    if on_message is not None:
+                        on_message(msg)
+                    payload = msg.payload
+                    message_type = payload[0]
+                    if not payloads:
+                        state['batch_in_stream'] = state['in_stream']
+                    if message_type == STREAM_START:
+                        state['in_stream'] = True
+                    elif message_type == STREAM_STOP:
+                        state['in_stream'] = False
+                    elif track_relations:
+                        # Streamed messages carry an xid before the relation OID
+                        start = 5 if state['in_stream'] else 1
+                        if message_type == RELATION:
+                            if payloads:
+                                submit(payloads, lsns)
+                                payloads, lsns = [], []
+                                state['batch_in_stream'] = state['in_stream']
+                            relation = decode_relation(payload, start)
+                            if relation_filter:
+                                relation_filter.add_relation(relation)
+                            if binary:
+                                relation_types[relation.relation_id] = (
+                                    relation.type_oids,
+                                    frozenset(oid for oid in relation.type_oids if oid in user_types))
+                        elif message_type == TYPE and binary:
+                            user_types.add(UINT32.unpack_from(payload, start)[0])
+                        elif (relation_filter and (message_type == INSERT or message_type == UPDATE
+                                                   or message_type == DELETE)
+                              and UINT32.unpack_from(payload, start)[0] in relation_filter.skipped):
+                            continue
+                    payloads.append(payload)
+                    lsns.append(msg.data_start)
+                    if len(payloads) >= batch_size:
+                        submit(payloads, lsns)
+                        payloads, lsns = [], []
+                    continue
+
+                if payloads:
+                    submit(payloads, lsns)
+                    payloads, lsns = [], []
+                feedback.maybe_send()
+                select.select([cursor], [], [], min(feedback.seconds_until_due() or feedback.interval, 0.5))
+            if payloads:
+                submit(payloads, lsns)
+        except Exception as e:
+            thread.error = e
+        finally:
+            pipeline.finish()
+
+    thread = threading.Thread(target=read, name='replication-reader', daemon=True)
+    thread.error = None
+    thread.start()
+    return thread, stop
@@ -0,0 +1,63 @@
+"""
+Offline replay of a capture file (see capture.py, CAPTURE_FILE in track_db.py)
+through the decoder and a sink, at full speed and without a replication slot.
+
+Usage: python replay.py <capture file> [--sink=null|jsonl|sqlite]
+"""
+import sys
+import time
+
+import track_db
+from capture import read_capture
+from metrics import ReplicationMetrics
+from sinks import BatchingSink, get_sink_writer
+
+# Slot consumer without a connection that the captured messages are applied to
+consumer = None
+
+
+def reset_state():
+    """Forget relations and open transactions left over from a previous replay."""
+    global consumer
+    if consumer is not None:
+        for streamed_transaction in consumer.streamed_transactions.values():
+            streamed_transaction.discard()
+    relations = track_db.RelationCache(track_db.conn_params, track_db.relation_filter.copy())
+    consumer = track_db.SlotConsumer(None, None, relations, ReplicationMetrics())
+
+
+def replay(records, sink):
+    """Feed (lsn, payload) pairs through track_db's decode/apply path. Returns the message count."""
+    if consumer is None:
+        reset_state()
+    decode = track_db.decode_pgoutput_message
+    handle = consumer.handle_message
+    skipped = consumer.relations.filter.skipped
+    count = 0
+    for _, payload in records:
+        handle(decode(payload, skipped, consumer.current_stream is not None), sink)
+        count += 1
+    sink.flush()
+    return count
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    kind = next((a.split('=', 1)[1] for a in sys.argv if a.startswith('--sink=')), 'null')
+
+    confirmed = []
+    sink = BatchingSink(get_sink_writer(kind), confirmed.append, track_db.SINK_BATCH_ROWS, track_db.SINK_BATCH_MS)
+    reset_state()
+    start = time.perf_counter()
+    count = replay(read_capture(args[0]), sink)
+    elapsed = time.perf_counter() - start
+    sink.close()
+    print(f"Replayed {count} messages in {elapsed:.3f}s ({count / elapsed:,.0f} msg/s), "
+          f"last confirmed LSN: {confirmed[-1] if confirmed else 0:X}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Helpers for driving a psycopg2 logical replication cursor.
+"""
+import select
+import time
+
+
+class FeedbackScheduler:
+    """
+    Batches standby status updates (send_feedback) for a replication cursor.
+
+    The flush position sent to the server only ever covers LSNs the sink has
+    confirmed through confirm(), so a crash can at worst replay changes, never
+    lose them. Feedback is sent every `every_messages` messages or every
+    `interval_ms` milliseconds, whichever comes first.
+    """
+
+    def __init__(self, cursor, every_messages=1000, interval_ms=1000):
+        self.cursor = cursor
+        self.every_messages = every_messages
+        self.interval = interval_ms / 1000
+        self.received_lsn = 0   # highest LSN read from the stream
+        self.confirmed_lsn = 0  # highest LSN the sink has made durable
+        self.sent_lsn = 0       # flush LSN last reported to the server
+        self.pending = 0        # messages received since the last feedback
+        self.last_sent = time.monotonic()
+
+    def received(self, lsn):
+        """Register a message read from the stream; sends feedback when a batch is due."""
+        if lsn > self.received_lsn:
+            self.received_lsn = lsn
+        self.pending += 1
+        if self.pending >= self.every_messages or time.monotonic() - self.last_sent >= self.interval:
+            self.send()
+
+    def confirm(self, lsn):
+        """Mark everything up to lsn as durably handled by the sink."""
+        if lsn > self.confirmed_lsn:
+            self.confirmed_lsn = lsn
+
+    def seconds_until_due(self):
+        return max(0.0, self.last_sent + self.interval - time.monotonic())
+
+    def maybe_send(self):
+        """Send feedback if the time interval has elapsed."""
+        if time.monotonic() - self.last_sent >= self.interval:
+            self.send()
+
+    def send(self):
+        # psycopg2 keeps the maximum of the positions it was given, so passing
+        # the received LSN as write position is only informational
+        self.cursor.send_feedback(write_lsn=self.received_lsn, flush_lsn=self.confirmed_lsn,
+                                  force=self.confirmed_lsn != self.sent_lsn)
+        self.sent_lsn = self.confirmed_lsn
+        self.pending = 0
+        self.last_sent = time.monotonic()
+
+
+def consume_stream(cursor, consume, feedback, on_idle=None, stop=None):
+    """
+    Replacement for cursor.consume_stream() that also flushes batched feedback
+    while the stream is idle. consume(msg) is called for every message and
+    on_idle() (e.g. a sink's time-based flush) whenever no message is waiting.
+    Returns once the threading.Event stop is set, if one is given.
+    """
+    while stop is None or not stop.is_set():
+        msg = cursor.read_message()
+        if msg is not None:
+            consume(msg)
+            feedback.received(msg.data_start)
+            continue
+
+        if on_idle is not None:
+            on_idle()
+        feedback.maybe_send()
+        select.select([cursor], [], [], feedback.seconds_until_due() or feedback.interval)
@@ -0,0 +1,117 @@
+"""
+Process-wide resources shared by the tools: the .env settings, one asyncpg
+pool and one aiohttp session.
+
+Nothing is opened at import. The pool and the session are created on first
+use from the DB_* settings (and the caller's options), so a tool only pays
+for the connections it actually needs, and every part of a tool that asks
+for them gets the same one. run() runs a tool's main() and closes whatever
+was created. Creation times are recorded in `timings` for the startup
+profile printed by va_toolbox.py. asyncio and the client libraries are
+imported on first use too, so commands that don't need them don't load them.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+# (label, start offset, seconds), offsets relative to STARTED
+STARTED = time.perf_counter()
+timings = []
+
+_env_loaded = False
+_pool_task = None
+_session_task = None
+
+
+@contextmanager
+def timed(label):
+    """Record how long the block takes under `label`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((label, start - STARTED, time.perf_counter() - start))
+
+
+def load_env():
+    """Load .env into os.environ, once per process."""
+    global _env_loaded
+    if not _env_loaded:
+        _env_loaded = True
+        with timed('load .env'):
+            from dotenv import load_dotenv
+            load_dotenv()
+
+
+async def get_pool(**options):
+    """
+    The shared asyncpg pool, created from the DB_* settings on the first call.
+    Options are passed on to asyncpg.create_pool and only apply to that call.
+    """
+    import asyncio
+    global _pool_task
+    if _pool_task is None:
+        _pool_task = asyncio.ensure_future(_create_pool(options))
+    return await asyncio.shield(_pool_task)
+
+
+async def _create_pool(options):
+    with timed('asyncpg pool'):
+        import asyncpg
+        load_env()
+        return await asyncpg.create_pool(
+            host=os.getenv('DB_HOST'),
+            port=os.getenv('DB_PORT'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            database=os.getenv('DB_NAME'),
+            ssl=False,  # Set SSL to meet specific requirements (adjust if needed)
+            **options
+        )
+
+
+async def get_http_session(**connector_options):
+    """
+    The shared aiohttp session, created on the first call. Options are passed
+    on to its aiohttp.TCPConnector and only apply to that call.
+    """
+    import asyncio
+    global _session_task
+    if _session_task is None:
+        _session_task = asyncio.ensure_future(_create_session(connector_options))
+    return await asyncio.shield(_session_task)
+
+
+async def _create_session(connector_options):
+    with timed('http session'):
+        import aiohttp
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(**connector_options))
+
+
+async def close():
+    """Close the shared pool and session, if they were created."""
+    import asyncio
+    global _pool_task, _session_task
+    tasks, _pool_task, _session_task = [_pool_task, _session_task], None, None
+    for task in tasks:
+        if task is None:
+            continue
+        if not task.done():
+            task.cancel()
+        try:
+            resource = await task
+        except (asyncio.CancelledError, Exception):
+            continue
+        await resource.close()
+
+
+def run(main):
+    """asyncio.run() a tool's main() coroutine, then close the shared resources."""
+    import asyncio
+
+    async def wrapper():
+        try:
+            return await main
+        finally:
+            await close()
+    return asyncio.run(wrapper())
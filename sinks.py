@@ -0,0 +1,232 @@
+"""
+Sinks that persist committed transactions from the replication stream.
+
+BatchingSink collects whole transactions and hands them to a writer in bulk
+(one executemany/COPY/buffered file write and one commit per batch). Once a
+batch is durable it reports the end LSN of its last transaction through
+on_flush, which is what the replication feedback is allowed to acknowledge.
+Several replication slots can share one BatchingSink: each write names the
+callback of its slot, and a flush reports every slot's own highest LSN.
+"""
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from pgoutput import UNCHANGED_TOAST, TupleData, pg_timestamp_to_datetime
+
+OPERATION_NAMES = {'I': 'INSERT', 'U': 'UPDATE', 'D': 'DELETE'}
+
+# One decoded row change; data/old are {column: value} dicts or None
+Row = namedtuple('Row', ['table_name', 'op', 'data', 'old'])
+
+# A committed transaction with all of its rows, in stream order
+Transaction = namedtuple('Transaction', ['xid', 'commit_lsn', 'end_lsn', 'commit_time', 'rows'])
+
+AUDIT_COLUMNS = ('xid', 'commit_lsn', 'commit_time', 'table_name', 'op', 'data', 'old')
+
+
+def row_data(values, columns, mask=None, decoders=None):
+    """
+    Turn a TupleData (or an already decoded value tuple) into a {column: value}
+    dict, leaving out unchanged TOAST values. With a column mask, columns are
+    the kept column names only; decoders are applied to binary format values.
+    """
+    if values is None:
+        return None
+    if isinstance(values, TupleData):
+        values = values.values(mask, decoders)
+    elif mask is not None and len(values) == len(mask):
+        # Decoded without the mask (by a decoder process that had not seen the relation yet)
+        values = tuple(value for value, keep in zip(values, mask) if keep)
+    if len(columns) < len(values):
+        columns = list(columns) + [f"unnamed_col_{i + 1}" for i in range(len(columns), len(values))]
+    return {name: value for name, value in zip(columns, values) if value is not UNCHANGED_TOAST}
+
+
+def audit_records(transactions, encode_json=True):
+    """Flatten transactions into tuples matching AUDIT_COLUMNS (data/old as JSON text if encode_json)."""
+    for txn in transactions:
+        commit_time = pg_timestamp_to_datetime(txn.commit_time).isoformat()
+        for row in txn.rows:
+            data, old = row.data, row.old
+            if encode_json:
+                data = json.dumps(data, default=str) if data is not None else None
+                old = json.dumps(old, default=str) if old is not None else None
+            yield txn.xid, txn.commit_lsn, commit_time, row.table_name, OPERATION_NAMES[row.op], data, old
+
+
+class BatchingSink:
+    """
+    Buffer committed transactions and write them in bulk. Safe to share between
+    threads; on_flush is the callback for writes that don't pass their own.
+    """
+
+    def __init__(self, writer, on_flush, max_rows=5000, max_delay_ms=1000, metrics=None):
+        self.writer = writer
+        self.metrics = metrics
+        self.on_flush = on_flush
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.transactions = []
+        self.callbacks = []  # on_flush of each buffered transaction
+        self.row_count = 0
+        self.first_buffered = None
+        self.lock = threading.RLock()
+
+    def write(self, transaction, on_flush=None):
+        on_flush = on_flush or self.on_flush
+        with self.lock:
+            if not transaction.rows and not self.transactions:
+                # Nothing published in this transaction and nothing waiting: it is safe to acknowledge
+                on_flush(transaction.end_lsn)
+                return
+            if not self.transactions:
+                self.first_buffered = time.monotonic()
+            self.transactions.append(transaction)
+            self.callbacks.append(on_flush)
+            self.row_count += len(transaction.rows)
+            if self.row_count >= self.max_rows or time.monotonic() - self.first_buffered >= self.max_delay:
+                self.flush()
+
+    def tick(self):
+        """Flush if the oldest buffered transaction has waited longer than max_delay."""
+        if self.transactions and time.monotonic() - self.first_buffered >= self.max_delay:
+            with self.lock:
+                if self.transactions and time.monotonic() - self.first_buffered >= self.max_delay:
+                    self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.transactions:
+                return
+            transactions, callbacks = self.transactions, self.callbacks
+            self.transactions = []
+            self.callbacks = []
+            self.row_count = 0
+            start = time.perf_counter()
+            self.writer.write_batch(transactions)
+            if self.metrics is not None:
+                self.metrics.sink_seconds.observe(time.perf_counter() - start)
+            # Highest end LSN per callback; chunks of a streamed transaction other than the last carry 0
+            confirmed = {}
+            for txn, on_flush in zip(transactions, callbacks):
+                if txn.end_lsn >= confirmed.get(on_flush, 0):
+                    confirmed[on_flush] = txn.end_lsn
+            for on_flush, lsn in confirmed.items():
+                on_flush(lsn)
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.writer.close()
+
+
+class JsonlWriter:
+    """Append audit records to rotating JSON Lines files."""
+
+    def __init__(self, directory, rotate_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.file = None
+        self.file_count = 0
+        self._open()
+
+    def _open(self):
+        self.file_count += 1
+        name = time.strftime('changes-%Y%m%d-%H%M%S') + f"-{self.file_count}.jsonl"
+        self.file = open(os.path.join(self.directory, name), 'a', encoding='utf-8', buffering=1024 * 1024)
+
+    def write_batch(self, transactions):
+        lines = [json.dumps(dict(zip(AUDIT_COLUMNS, record)), default=str)
+                 for record in audit_records(transactions, encode_json=False)]
+        self.file.write('\n'.join(lines) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        if self.file.tell() >= self.rotate_bytes:
+            self.file.close()
+            self._open()
+
+    def close(self):
+        self.file.close()
+
+
+class SQLiteWriter:
+    """Insert audit records into a local SQLite table, one transaction per batch."""
+
+    def __init__(self, path, table='change_audit'):
+        self.table = table
+        # Batches may come from several slot threads; BatchingSink serializes them
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                xid INTEGER, commit_lsn INTEGER, commit_time TEXT,
+                table_name TEXT, op TEXT, data TEXT, old TEXT
+            )""")
+        self.insert_sql = f"INSERT INTO {table} ({', '.join(AUDIT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+    def write_batch(self, transactions):
+        with self.db:
+            self.db.executemany(self.insert_sql, audit_records(transactions))
+
+    def close(self):
+        self.db.close()
+
+
+class PostgresWriter:
+    """COPY audit records into a Postgres table, one transaction per batch."""
+
+    def __init__(self, conn_params, table='change_audit'):
+        import psycopg2
+
+        self.table = table
+        self.conn = psycopg2.connect(**conn_params)
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    xid bigint, commit_lsn bigint, commit_time timestamptz,
+                    table_name text, op text, data jsonb, old jsonb
+                )""")
+        self.copy_sql = f"COPY {table} ({', '.join(AUDIT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+    def write_batch(self, transactions):
+        buf = io.StringIO()
+        csv.writer(buf).writerows(audit_records(transactions))
+        buf.seek(0)
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.copy_expert(self.copy_sql, buf)
+
+    def close(self):
+        self.conn.close()
+
+
+class NullWriter:
+    """Serialize audit records and drop them; for benchmarks and dry runs."""
+
+    def write_batch(self, transactions):
+        for _ in audit_records(transactions):
+            pass
+
+    def close(self):
+        pass
+
+
+def get_sink_writer(kind, conn_params=None):
+    """Create the writer selected by the SINK environment variable."""
+    path = os.getenv('SINK_PATH')
+    table = os.getenv('SINK_TABLE', 'change_audit')
+    if kind == 'jsonl':
+        return JsonlWriter(path or 'changes', int(os.getenv('SINK_ROTATE_BYTES', str(256 * 1024 * 1024))))
+    if kind == 'sqlite':
+        return SQLiteWriter(path or 'changes.sqlite3', table)
+    if kind == 'postgres':
+        return PostgresWriter(conn_params, table)
+    if kind == 'null':
+        return NullWriter()
+    raise ValueError(f"Unknown sink: {kind}")
@@ -0,0 +1,60 @@
+"""
+Memory-bounded buffering of streamed (protocol v2) in-progress transactions.
+
+Rows are kept in memory up to max_memory_rows and then appended in pickled
+chunks to an anonymous temporary file, so memory stays flat however large
+the transaction gets. Aborting a transaction just closes its file (the OS
+removes it); aborted subtransactions are remembered and filtered out when
+the rows are read back at commit.
+"""
+import pickle
+import tempfile
+
+
+class StreamedTransaction:
+    """Rows of one streamed transaction, tagged with the (sub)transaction xid that produced them."""
+
+    def __init__(self, xid, max_memory_rows=10000, spill_dir=None):
+        self.xid = xid
+        self.max_memory_rows = max_memory_rows
+        self.spill_dir = spill_dir
+        self.rows = []               # (subxid, row) pairs not yet spilled
+        self.spill_file = None
+        self.spilled_rows = 0
+        self.aborted_subxids = set()
+
+    def add(self, subxid, row):
+        self.rows.append((subxid, row))
+        if len(self.rows) >= self.max_memory_rows:
+            self.spill()
+
+    def spill(self):
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix=f"txn-{self.xid}-", dir=self.spill_dir)
+        pickle.dump(self.rows, self.spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spilled_rows += len(self.rows)
+        self.rows = []
+
+    def abort_subtransaction(self, subxid):
+        self.aborted_subxids.add(subxid)
+        self.rows = [(xid, row) for xid, row in self.rows if xid != subxid]
+
+    def chunks(self):
+        """Yield lists of committed rows in stream order: spilled chunks first, then memory."""
+        aborted = self.aborted_subxids
+        if self.spill_file is not None:
+            self.spill_file.seek(0)
+            while True:
+                try:
+                    chunk = pickle.load(self.spill_file)
+                except EOFError:
+                    break
+                yield [row for xid, row in chunk if xid not in aborted]
+        if self.rows:
+            yield [row for xid, row in self.rows if xid not in aborted]
+
+    def discard(self):
+        self.rows = []
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
@@ -0,0 +1,130 @@
+"""
+Synthetic pgoutput message streams for benchmarks and offline replay.
+
+The build_* helpers encode single protocol v1 messages; the workload
+generators yield (lsn, payload) pairs for complete sessions (Relation
+messages first, then Begin/changes/Commit), in the same shape as a capture
+file recorded from a live slot.
+"""
+import struct
+
+UNCHANGED = object()  # marker for an unchanged TOASTed column in build_tuple
+
+TEXT_OID = 25
+INT4_OID = 23
+
+
+def build_tuple(values):
+    """Encode a list of text values (None for NULL, UNCHANGED for unchanged TOAST) as TupleData."""
+    parts = [struct.pack('!H', len(values))]
+    for value in values:
+        if value is None:
+            parts.append(b'n')
+        elif value is UNCHANGED:
+            parts.append(b'u')
+        else:
+            data = value.encode('utf-8')
+            parts.append(b't' + struct.pack('!I', len(data)) + data)
+    return b''.join(parts)
+
+
+def build_relation(relation_id, namespace, name, columns, type_oids=None, key_columns=('id',)):
+    type_oids = type_oids or [TEXT_OID] * len(columns)
+    parts = [b'R', struct.pack('!I', relation_id), namespace.encode() + b'\0', name.encode() + b'\0', b'd',
+             struct.pack('!H', len(columns))]
+    for column, type_oid in zip(columns, type_oids):
+        parts.append(bytes([1 if column in key_columns else 0]) + column.encode() + b'\0'
+                     + struct.pack('!Ii', type_oid, -1))
+    return b''.join(parts)
+
+
+def build_begin(final_lsn, xid, commit_time=0):
+    return b'B' + struct.pack('!QqI', final_lsn, commit_time, xid)
+
+
+def build_commit(commit_lsn, end_lsn, commit_time=0):
+    return b'C' + struct.pack('!BQQq', 0, commit_lsn, end_lsn, commit_time)
+
+
+def build_insert(relation_id, values):
+    return b'I' + struct.pack('!I', relation_id) + b'N' + build_tuple(values)
+
+
+def build_update(relation_id, key_values, values):
+    return (b'U' + struct.pack('!I', relation_id)
+            + b'K' + build_tuple(key_values)
+            + b'N' + build_tuple(values))
+
+
+def build_delete(relation_id, key_values):
+    return b'D' + struct.pack('!I', relation_id) + b'K' + build_tuple(key_values)
+
+
+def _session(relations, transactions):
+    """Number the messages of a session with increasing fake LSNs."""
+    lsn = 0x1000000
+    for payload in relations:
+        yield lsn, payload
+        lsn += len(payload)
+    for xid, changes in enumerate(transactions, start=1000):
+        changes = list(changes)
+        end_lsn = lsn + sum(len(c) for c in changes) + 64
+        yield lsn, build_begin(end_lsn, xid)
+        for payload in changes:
+            lsn += len(payload)
+            yield lsn, payload
+        yield end_lsn, build_commit(end_lsn, end_lsn + 1)
+        lsn = end_lsn + 1
+
+
+def wide_rows(transactions=1000, rows_per_transaction=10, columns=200):
+    """Inserts into a very wide table."""
+    names = ['id'] + [f"c{i}" for i in range(1, columns)]
+    relation = build_relation(16400, 'public', 'wide', names)
+    return _session([relation], (
+        [build_insert(16400, [str(t * rows_per_transaction + r)] + [f"v{c}" for c in range(1, columns)])
+         for r in range(rows_per_transaction)]
+        for t in range(transactions)))
+
+
+def small_transactions(transactions=50000, columns=8):
+    """One short UPDATE per transaction, the typical OLTP shape."""
+    names = ['id', 'status'] + [f"c{i}" for i in range(2, columns)]
+    relation = build_relation(16401, 'reservation', 'booking', names)
+    return _session([relation], (
+        [build_update(16401, [str(t)], [str(t), 'CLOSED'] + [f"v{c}" for c in range(2, columns)])]
+        for t in range(transactions)))
+
+
+def toast_unchanged(transactions=5000, rows_per_transaction=5, columns=12):
+    """Updates where large TOASTed columns were not changed and are not sent."""
+    names = ['id', 'status'] + [f"doc{i}" for i in range(2, columns)]
+    relation = build_relation(16402, 'public', 'documents', names)
+    return _session([relation], (
+        [build_update(16402, [str(t)], [str(t), 'OPEN'] + [UNCHANGED] * (columns - 2))
+         for _ in range(rows_per_transaction)]
+        for t in range(transactions)))
+
+
+def mostly_nulls(transactions=5000, rows_per_transaction=10, columns=40):
+    """Inserts and deletes of sparse rows."""
+    names = ['id'] + [f"c{i}" for i in range(1, columns)]
+    relation = build_relation(16403, 'public', 'sparse', names)
+
+    def changes(t):
+        for r in range(rows_per_transaction):
+            key = str(t * rows_per_transaction + r)
+            if r % 4 == 3:
+                yield build_delete(16403, [key])
+            else:
+                yield build_insert(16403, [key] + [None if c % 5 else 'x' for c in range(1, columns)])
+
+    return _session([relation], (changes(t) for t in range(transactions)))
+
+
+WORKLOADS = {
+    'wide_rows': wide_rows,
+    'small_transactions': small_transactions,
+    'toast_unchanged': toast_unchanged,
+    'mostly_nulls': mostly_nulls,
+}
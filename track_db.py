@@ -1,15 +1,25 @@
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
-import struct
 import os
 import platform
-from dotenv import load_dotenv
+import threading
+import time
+from collections import namedtuple
 
-# Load the environment variables from the .env file
-load_dotenv()
+from pgoutput import (Begin, Change, Commit, Relation, RelationFilter, StreamAbort, StreamCommit, StreamStart,
+                      StreamStop, Type, decode_pgoutput_message)
+from capture import CaptureWriter
+from metrics import MetricsGroup, ReplicationMetrics, serve_metrics, start_textfile_writer
+from pgtypes import decoders_for
+from pipeline import DecodePipeline, start_reader
+from replication import FeedbackScheduler, consume_stream
+from sinks import BatchingSink, Row, Transaction, get_sink_writer, row_data
+from spill import StreamedTransaction
+from resources import load_env, timed
 
-# Dictionary to map relation IDs to table names and columns
-relation_map = {}
+# Load the environment variables from the .env file
+load_env()
 
 # Define connection details from environment variables
 conn_params = {
@@ -20,33 +30,185 @@ conn_params = {
     'port': os.getenv('DB_PORT'),        # PostgreSQL port from .env
 }
 
-# Function to populate the relation_map with relation id, table names, and columns
-def fetch_relation_map():
-    global relation_map
-    try:
-        with psycopg2.connect(**conn_params) as metadata_conn:
-            with metadata_conn.cursor() as cursor:
+# Replication feedback batching: acknowledge every N messages or T milliseconds
+FEEDBACK_EVERY_MESSAGES = int(os.getenv('FEEDBACK_EVERY_MESSAGES', '1000'))
+FEEDBACK_INTERVAL_MS = int(os.getenv('FEEDBACK_INTERVAL_MS', '1000'))
+
+# Where committed transactions are written: 'jsonl', 'sqlite' or 'postgres'
+SINK = os.getenv('SINK', 'jsonl')
+SINK_BATCH_ROWS = int(os.getenv('SINK_BATCH_ROWS', '5000'))
+SINK_BATCH_MS = int(os.getenv('SINK_BATCH_MS', '1000'))
+
+# Logical replication protocol. STREAMING=on (protocol 2+) makes the server send large
+# in-progress transactions in chunks instead of buffering them until commit.
+PROTO_VERSION = os.getenv('PROTO_VERSION', '1')
+STREAMING = os.getenv('STREAMING', 'off')
+if STREAMING == 'on' and int(PROTO_VERSION) < 2:
+    PROTO_VERSION = '2'
+# BINARY=on asks pgoutput for binary column values, decoded by type OID into native types
+BINARY = os.getenv('BINARY', 'off') == 'on'
+# Rows of a streamed transaction kept in memory before spilling to SPILL_DIR
+STREAM_SPILL_ROWS = int(os.getenv('STREAM_SPILL_ROWS', '10000'))
+SPILL_DIR = os.getenv('SPILL_DIR') or None
+
+# Pipelined decoding: number of decoder processes per slot (0 decodes inline) and payloads per batch.
+# Only worth it with 2+ workers on as many spare cores: one worker is slower than inline decoding,
+# and the sink and row dicts stay on this process, which caps the gain (bench_pgoutput.py --workers=N)
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', '0'))
+DECODE_BATCH_SIZE = int(os.getenv('DECODE_BATCH_SIZE', '500'))
+
+# Metrics: Prometheus endpoint on 127.0.0.1:METRICS_PORT and/or a textfile at METRICS_TEXTFILE
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE')
+
+# AA_CLEANUP=on deletes the AA persons of bookings whose status moves into a delete
+# status, debounced into batches (see assaabloy/booking_watch.py)
+AA_CLEANUP = os.getenv('AA_CLEANUP', 'off') == 'on'
+
+# CAPTURE_FILE records every raw payload with its LSN for offline replay (see replay.py);
+# with several slots there is one file per slot, named <name>.<slot><ext>
+CAPTURE_FILE = os.getenv('CAPTURE_FILE')
+
+
+def env_list(name):
+    return [item.strip() for item in os.getenv(name, '').split(',') if item.strip()]
+
+
+# Tables ('schema.table') and columns ('schema.table.column') to follow, wildcards allowed.
+# Changes of other relations are dropped before their tuples are parsed. Every database
+# gets its own copy, as relation OIDs are only unique within one database.
+relation_filter = RelationFilter(
+    include_tables=env_list('FILTER_INCLUDE_TABLES'),
+    exclude_tables=env_list('FILTER_EXCLUDE_TABLES'),
+    include_columns=env_list('FILTER_INCLUDE_COLUMNS'),
+    exclude_columns=env_list('FILTER_EXCLUDE_COLUMNS'),
+)
+
+# One slot to consume and the connection parameters of its database
+SlotConfig = namedtuple('SlotConfig', ['slot', 'publication', 'conn_params'])
+
+
+# Slots to consume, all in this process. REPLICATION_SLOTS is a comma separated list of
+# 'slot:publication' entries, each optionally followed by '@' and a connection string (URL
+# or key=value) for a database other than the DB_* one; without ':publication' the slot uses
+# PUBLICATION_NAME. Unset, the single REPLICATION_SLOT / PUBLICATION_NAME pair is consumed.
+def slot_configs():
+    entries = env_list('REPLICATION_SLOTS')
+    if not entries:
+        return [SlotConfig(os.getenv('REPLICATION_SLOT'), os.getenv('PUBLICATION_NAME'), conn_params)]
+    configs = []
+    for entry in entries:
+        names, _, dsn = entry.partition('@')
+        slot, _, publication = names.partition(':')
+        configs.append(SlotConfig(slot.strip(), publication.strip() or os.getenv('PUBLICATION_NAME'),
+                                  {'dsn': dsn.strip()} if dsn.strip() else conn_params))
+    return configs
+
+
+# Identify the database behind connection parameters, to share its relation cache
+def database_key(params):
+    if 'dsn' in params:
+        params = psycopg2.extensions.parse_dsn(params['dsn'])
+    return params.get('host'), str(params.get('port') or ''), params.get('dbname')
+
+
+class RelationCache:
+    """
+    Relation and type metadata of one database, shared by the slots reading from it.
+
+    An entry (column names, filter mask, binary decoders) is built once per table
+    layout, i.e. per distinct Relation message, and shared by every slot that sees
+    that layout. Each slot still maps relation OIDs to entries itself (see
+    SlotConsumer.relation_map): after DDL, a slot that is behind keeps the layout its
+    own stream announced until its own Relation message arrives. OIDs no slot has a
+    Relation message for yet are looked up in the catalog, over one metadata
+    connection opened on the first miss.
+    """
+
+    def __init__(self, conn_params, relation_filter):
+        self.conn_params = conn_params
+        self.filter = relation_filter
+        self.layouts = {}   # Relation message -> entry
+        self.latest = {}    # relation OID -> entry of the newest layout seen by any slot
+        self.type_map = {}  # Type names keyed by type OID, filled from Type messages (user-defined types only)
+        self.metadata_conn = None
+        self.lock = threading.Lock()
+
+    # Store the table layout carried by a Relation message. Postgres sends one before the
+    # first change of every relation in the session and again after DDL.
+    def add(self, relation):
+        entry = self.layouts.get(relation)
+        if entry is None:
+            with self.lock:
+                entry = self.layouts.get(relation)
+                if entry is None:
+                    entry = self._make_entry(relation)
+                    self.layouts[relation] = entry
+        self.latest[relation.relation_id] = entry
+        return entry
+
+    def _make_entry(self, relation):
+        self.filter.add_relation(relation)
+        mask = self.filter.masks.get(relation.relation_id)
+        return {
+            'table_name': f"{relation.namespace}.{relation.name}",
+            'columns': list(relation.columns),
+            'type_oids': list(relation.type_oids),
+            'key_columns': list(relation.key_columns),
+            'skipped': relation.relation_id in self.filter.skipped,
+            'mask': mask,
+            'kept_columns': [c for c, keep in zip(relation.columns, mask) if keep] if mask else list(relation.columns),
+            'decoders': decoders_for(tuple(relation.type_oids), self.user_types(relation)) if BINARY else None,
+        }
+
+    def add_type(self, type_message):
+        self.type_map[type_message.type_oid] = f"{type_message.namespace}.{type_message.name}"
+
+    # The relation's column types announced by Type messages, which binary mode decodes as text
+    def user_types(self, relation):
+        return frozenset(type_oid for type_oid in relation.type_oids if type_oid in self.type_map)
+
+    def get(self, relation_id):
+        """Newest known entry for a relation OID, from the catalog if no slot has seen it yet."""
+        entry = self.latest.get(relation_id)
+        if entry is None:
+            with self.lock:
+                row = self._fetch(relation_id)
+            if row is not None:
+                schema, table, columns, type_oids = row
+                entry = self.add(Relation(relation_id, schema, table, None, tuple(columns), tuple(type_oids),
+                                          (False,) * len(columns)))
+        return entry
+
+    # Fallback catalog lookup for a single relation OID missing from the cache
+    def _fetch(self, relation_id):
+        try:
+            if self.metadata_conn is None:
+                self.metadata_conn = psycopg2.connect(**self.conn_params)
+                self.metadata_conn.autocommit = True
+            with self.metadata_conn.cursor() as cursor:
                 query = """
-                SELECT c.oid, n.nspname, c.relname,
-                       array_agg(a.attname ORDER BY a.attnum) AS column_names
+                SELECT n.nspname, c.relname,
+                       array_agg(a.attname ORDER BY a.attnum) AS column_names,
+                       array_agg(a.atttypid::int8 ORDER BY a.attnum) AS type_oids
                 FROM pg_class c
                 JOIN pg_namespace n ON c.relnamespace = n.oid
                 JOIN pg_attribute a ON a.attrelid = c.oid
-                WHERE c.relkind IN ('r', 'p')  -- 'r' for regular tables, 'p' for partitioned tables
+                WHERE c.oid = %s
                   AND a.attnum > 0  -- Exclude system columns
                   AND NOT a.attisdropped  -- Exclude dropped columns
-                GROUP BY c.oid, n.nspname, c.relname
+                GROUP BY n.nspname, c.relname
                 """
-                cursor.execute(query)
-                rows = cursor.fetchall()
-                for oid, schema, table, columns in rows:
-                    relation_map[oid] = {
-                        'table_name': f"{schema}.{table}",
-                        'columns': columns
-                    }
+                cursor.execute(query, (relation_id,))
+                return cursor.fetchone()
+        except psycopg2.Error as e:
+            print(f"Error fetching relation {relation_id}:", e)
+            return None
 
-    except psycopg2.Error as e:
-        print("Error fetching relation map:", e)
+    def close(self):
+        if self.metadata_conn is not None:
+            self.metadata_conn.close()
+            self.metadata_conn = None
 
 
 def clear_console():
@@ -57,170 +219,311 @@ def clear_console():
 
 
 # Make a replication connection
-try:
-    # Make sure to use `ReplicationConnection` for logical replication
-    conn = psycopg2.connect(
-        dbname=conn_params['dbname'],
-        user=conn_params['user'],
-        password=conn_params['password'],
-        host=conn_params['host'],
-        port=conn_params['port'],
-        connection_factory=psycopg2.extras.LogicalReplicationConnection,
-        replication=psycopg2.extras.REPLICATION_LOGICAL
-    )
-    print("Replication connection established")
-except psycopg2.Error as e:
-    print("Error connecting to PostgreSQL replication:", e)
-    exit(1)
-
-
-# Function to decode logical replication messages
-def decode_pgoutput_message(payload):
-    message_type = payload[0:1].decode('ascii')
-    if payload[0:1].decode('ascii') == 'B':  # Transaction BEGIN (optional)
-        return
-
-    if message_type == 'I':  # INSERT message
-        print("----------------")
-        print("INSERT operation detected.")
-        relation_id, = struct.unpack('!I', payload[1:5])  # Decode relation OID (4 bytes)
-        relation_info = relation_map.get(relation_id, None)
-        if relation_info:
-            table_name = relation_info['table_name']
-            columns = relation_info['columns']
-        else:
-            table_name = 'Unknown relation'
-            columns = []
-        print(f"Insert into table: {table_name}")
-
-        rest = payload[5:]
-
-        if rest[0:1].decode('ascii') == 'N':
-            column_count = struct.unpack('!H', rest[1:3])[0]  # Number of columns (2-byte integer)
-            offset = 3
-            print(f"Number of columns in insertion: {column_count}")
-            for col_idx in range(column_count):
-                isnull = rest[offset:offset+1]  # Nullable flag
-                col_name = columns[col_idx] if col_idx < len(columns) else f"unnamed_col_{col_idx + 1}"
-                if isnull == b't':
-                    offset += 1
-                    col_len = struct.unpack('!I', rest[offset:offset+4])[0]
-                    offset += 4
-                    col_value = rest[offset:offset+col_len].decode('utf-8')
-                    offset += col_len
-                    print(f"{col_name}: {col_value}")
-                else:
-                    offset += 1
-                    print(f"{col_name}: NULL")
-        return
-
-    elif message_type == 'U':  # UPDATE message
-        print("----------------")
-        print("UPDATE operation detected.")
-        relation_id, = struct.unpack('!I', payload[1:5])  # Decode relation OID (4 bytes)
-        relation_info = relation_map.get(relation_id, None)
-        if relation_info:
-            table_name = relation_info['table_name']
-            columns = relation_info['columns']
-        else:
-            table_name = 'Unknown relation'
-            columns = []
-        print(f"Update in table: {table_name}")
-        rest = payload[5:]
-
-        if rest[0:1].decode('ascii') == 'K':
-            print("Key tuple (identifying row before update) follows.")
-            rest = rest[1:]
-
-        if rest[0:1].decode('ascii') == 'N':
-            print("New tuple values after update:")
-            rest = rest[1:]
-            column_count = struct.unpack('!H', rest[0:2])[0]
-            offset = 2
-            print(f"Number of columns in update: {column_count}")
-            for col_idx in range(column_count):
-                isnull = rest[offset:offset+1]  # Nullable flag
-                col_name = columns[col_idx] if col_idx < len(columns) else f"unnamed_col_{col_idx + 1}"
-                if isnull == b't':
-                    offset += 1
-                    col_len = struct.unpack('!I', rest[offset:offset+4])[0]
-                    offset += 4
-                    col_value = rest[offset:offset+col_len].decode('utf-8')
-                    offset += col_len
-                    print(f"{col_name}: {col_value}")
-                else:
-                    offset += 1
-                    print(f"{col_name}: NULL")
-
-        return
-
-    elif message_type == 'D':  # DELETE message
-        print("----------------")
-        print("DELETE operation detected.")
-        relation_id, = struct.unpack('!I', payload[1:5])
-        relation_info = relation_map.get(relation_id, None)
+def connect_replication(params):
+    try:
+        # Make sure to use `ReplicationConnection` for logical replication
+        with timed('replication connection'):
+            conn = psycopg2.connect(
+                **params,
+                connection_factory=psycopg2.extras.LogicalReplicationConnection,
+                replication=psycopg2.extras.REPLICATION_LOGICAL
+            )
+        print("Replication connection established")
+        return conn
+    except psycopg2.Error as e:
+        print("Error connecting to PostgreSQL replication:", e)
+        exit(1)
+
+
+class SlotConsumer:
+    """
+    Consumer of one replication slot: its own replication connection, feedback
+    and in-flight transaction state, and its own metrics. Committed transactions
+    go to a sink that may be shared with other slots; each one carries this
+    slot's feedback.confirm, so a flush acknowledges only what it made durable.
+    """
+
+    def __init__(self, slot, publication, relations, metrics, capture=None, conn_params=None):
+        self.slot = slot
+        self.publication = publication
+        self.conn_params = conn_params
+        self.relations = relations  # RelationCache of the slot's database
+        self.relation_map = {}      # relation OID -> entry, as announced on this slot's stream
+        self.metrics = metrics
+        self.capture = capture
+        self.conn = None
+        self.cursor = None
+        self.feedback = None
+        self.confirm = None  # sink flush callback; None (offline replay) uses the sink's own
+
+        # Rows of the transaction currently being received (between Begin and Commit)
+        self.current_begin = None
+        self.current_rows = []
+
+        # Streamed in-progress transactions by xid, and the one whose block is being received
+        self.streamed_transactions = {}
+        self.current_stream = None
+
+    def get_relation(self, relation_id):
+        relation_info = self.relation_map.get(relation_id)
+        if relation_info is None:
+            relation_info = self.relations.get(relation_id)
+            if relation_info is not None:
+                self.relation_map[relation_id] = relation_info
+        return relation_info
+
+    # Decode a row change into a Row with column names from the relation cache.
+    # Returns None for relations excluded by the filter.
+    def make_row(self, change):
+        relation_info = self.get_relation(change.relation_id)
+        mask = decoders = None
         if relation_info:
+            if relation_info['skipped']:
+                return None
             table_name = relation_info['table_name']
-            columns = relation_info['columns']
+            columns = relation_info['kept_columns']
+            mask = relation_info['mask']
+            decoders = relation_info['decoders']
         else:
             table_name = 'Unknown relation'
             columns = []
-        print(f"Delete from table: {table_name}")
-        rest = payload[5:]
-
-        if rest[0:1].decode('ascii') == 'K':
-            print("Key tuple (identifying row to delete) follows.")
-            column_count = struct.unpack('!H', rest[1:3])[0]
-            offset = 3
-            print(f"Number of columns in key tuple: {column_count}")
-            for col_idx in range(column_count):
-                isnull = rest[offset:offset+1]
-                col_name = columns[col_idx] if col_idx < len(columns) else f"unnamed_col_{col_idx + 1}"
-                if isnull == b't':
-                    offset += 1
-                    col_len = struct.unpack('!I', rest[offset:offset+4])[0]
-                    offset += 4
-                    col_value = rest[offset:offset+col_len].decode('utf-8')
-                    offset += col_len
-                    print(f"{col_name}: {col_value}")
-                else:
-                    offset += 1
-                    print(f"{col_name}: NULL")
-        return
-
-
-# Stream changes from PostgreSQL replication
-def stream_changes():
-    with conn.cursor() as cur:
-        print("Starting logical streaming replication...")
-
-        # Fetch the OID to table relation mapping before starting replication
-        fetch_relation_map()
+        self.metrics.row(table_name)
+        return Row(table_name, change.op, row_data(change.new, columns, mask, decoders),
+                   row_data(change.old, columns, mask, decoders))
+
+    # Apply one decoded message: collect rows per transaction and hand committed
+    # transactions to the sink
+    def handle_message(self, message, sink):
+        if isinstance(message, Change):
+            row = self.make_row(message)
+            if row is None:
+                return
+            if self.current_stream is not None:
+                self.current_stream.add(message.xid, row)
+            else:
+                self.current_rows.append(row)
+        elif isinstance(message, Begin):
+            self.current_begin = message
+            self.current_rows = []
+        elif isinstance(message, Commit):
+            self.metrics.committed(message.commit_time)
+            sink.write(Transaction(self.current_begin.xid, message.commit_lsn, message.end_lsn,
+                                   message.commit_time, self.current_rows), self.confirm)
+            self.current_begin = None
+            self.current_rows = []
+        elif isinstance(message, StreamStart):
+            self.current_stream = self.streamed_transactions.get(message.xid)
+            if self.current_stream is None:
+                self.current_stream = StreamedTransaction(message.xid, STREAM_SPILL_ROWS, SPILL_DIR)
+                self.streamed_transactions[message.xid] = self.current_stream
+        elif isinstance(message, StreamStop):
+            self.current_stream = None
+        elif isinstance(message, StreamCommit):
+            self.metrics.committed(message.commit_time)
+            self.write_streamed_transaction(self.streamed_transactions.pop(message.xid), message, sink)
+        elif isinstance(message, StreamAbort):
+            if message.subxid == message.xid:
+                streamed_transaction = self.streamed_transactions.pop(message.xid, None)
+                if streamed_transaction is not None:
+                    streamed_transaction.discard()
+            elif message.xid in self.streamed_transactions:
+                self.streamed_transactions[message.xid].abort_subtransaction(message.subxid)
+        elif isinstance(message, Relation):
+            self.relation_map[message.relation_id] = self.relations.add(message)
+        elif isinstance(message, Type):
+            self.relations.add_type(message)
+
+    # Hand a committed streamed transaction to the sink chunk by chunk, so it is never
+    # fully loaded into memory. Only the last chunk carries the end LSN to acknowledge.
+    def write_streamed_transaction(self, streamed_transaction, commit, sink):
+        previous = None
+        for chunk in streamed_transaction.chunks():
+            if previous is not None:
+                sink.write(Transaction(streamed_transaction.xid, commit.commit_lsn, 0, commit.commit_time, previous),
+                           self.confirm)
+            previous = chunk
+        sink.write(Transaction(streamed_transaction.xid, commit.commit_lsn, commit.end_lsn, commit.commit_time,
+                               previous or []), self.confirm)
+        streamed_transaction.discard()
+
+    # Bookkeeping for every raw message received, before decoding
+    def on_message(self, msg):
+        self.metrics.received(msg)
+        if self.capture is not None:
+            self.capture.write(msg.data_start, msg.payload)
+
+    # Decode and apply one message read inline from the replication cursor
+    def consume_message(self, msg, sink):
+        self.on_message(msg)
+        start = time.perf_counter()
+        message = decode_pgoutput_message(msg.payload, self.relations.filter.skipped, self.current_stream is not None)
+        self.handle_message(message, sink)
+        if isinstance(message, Change):
+            self.metrics.decode_seconds.observe(time.perf_counter() - start)
+
+    # Open the replication connection and start streaming from the slot
+    def start(self):
+        self.conn = connect_replication(self.conn_params)
+        self.cursor = self.conn.cursor()
+        print(f"Starting logical streaming replication from slot {self.slot}...")
+
+        options = {
+            'proto_version': PROTO_VERSION,
+            'publication_names': self.publication
+        }
+        if STREAMING == 'on':
+            options['streaming'] = 'on'
+        if BINARY:
+            options['binary'] = 'true'
 
         # Start replication from logical slot
-        cur.start_replication(
-            slot_name=os.getenv('REPLICATION_SLOT'),  # Slot name from .env
-            options={
-                'proto_version': '1',
-                'publication_names': os.getenv('PUBLICATION_NAME')  # Publication name from .env
-            }
-        )
-
-        def consume_change(msg):
-            if msg:
-                decode_pgoutput_message(msg.payload)
-                msg.cursor.send_feedback(flush_lsn=msg.data_start)
+        self.cursor.start_replication(slot_name=self.slot, options=options)
+
+        self.feedback = FeedbackScheduler(self.cursor, FEEDBACK_EVERY_MESSAGES, FEEDBACK_INTERVAL_MS)
+        self.metrics.feedback = self.feedback
+        # Only LSNs of transactions the sink has made durable are acknowledged
+        self.confirm = self.feedback.confirm
+
+    # Stream changes until stop is set
+    def run(self, sink, stop):
+        if DECODE_WORKERS > 0:
+            self.stream_pipelined(sink, stop)
+        else:
+            consume_stream(self.cursor, lambda msg: self.consume_message(msg, sink), self.feedback, sink.tick, stop)
+
+    # Decode on a pool of worker processes while a reader thread keeps receiving
+    def stream_pipelined(self, sink, stop):
+        decoder = DecodePipeline(DECODE_WORKERS)
+        reader, stop = start_reader(self.cursor, decoder, self.feedback, DECODE_BATCH_SIZE,
+                                    self.relations.filter.copy(), BINARY, self.on_message, stop)
 
+        def on_batch(seconds, count):
+            self.metrics.decode_seconds.observe(seconds / count)
+
+        try:
+            for message, _ in decoder.results(on_idle=sink.tick, on_batch=on_batch):
+                self.handle_message(message, sink)
+            if reader.error is not None:
+                raise reader.error
+        finally:
+            stop.set()
+            # Unblocks the reader if it is waiting on a full queue
+            decoder.drain()
+            reader.join()
+            decoder.close()
+
+    # Acknowledge what the sink has confirmed and close the connection; call after the sink is closed
+    def close(self):
+        if self.feedback is not None:
+            try:
+                self.feedback.send()
+            except psycopg2.Error as e:
+                print(f"Error sending final feedback for slot {self.slot}:", e)
+            self.feedback = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+
+
+# Wrap the sink writer so committed booking status changes trigger AA person cleanup
+def watch_booking_status(writer):
+    # Imported here so the AA client stack is only loaded when the cleanup is enabled
+    from assaabloy.booking_watch import AAPersonCleaner, BookingStatusWatcher
+
+    cleaner = AAPersonCleaner(
+        debounce_ms=int(os.getenv('AA_CLEANUP_DEBOUNCE_MS', '2000')),
+        max_delay_ms=int(os.getenv('AA_CLEANUP_MAX_DELAY_MS', '10000')),
+        max_batch=int(os.getenv('AA_CLEANUP_MAX_BATCH', '500')),
+        concurrency=int(os.getenv('AA_CLEANUP_CONCURRENCY', '10')),
+    )
+    return BookingStatusWatcher(writer, cleaner)
+
+
+# Run the consumers into the shared sink, each slot on its own thread (a single slot runs
+# on the main thread). The first slot to fail stops all of them, so none lags unnoticed;
+# the sink is then flushed and every slot acknowledges what it confirmed.
+def consume_slots(consumers, sink):
+    stop = threading.Event()
+    errors = []
+    threads = []
+
+    def run(consumer):
         try:
-            cur.consume_stream(consume_change)
-        except KeyboardInterrupt:
-            print("\nStopping replication stream...")
-
-
-try:
-    stream_changes()
-except Exception as e:
-    print(f"Error during replication: {e}")
-finally:
-    # Close PostgreSQL connection
-    conn.close()
+            consumer.run(sink, stop)
+        except Exception as e:
+            errors.append((consumer.slot, e))
+        finally:
+            stop.set()
+
+    try:
+        if len(consumers) == 1:
+            run(consumers[0])
+        else:
+            threads = [threading.Thread(target=run, args=(consumer,), name=f"slot-{consumer.slot}", daemon=True)
+                       for consumer in consumers]
+            for thread in threads:
+                thread.start()
+            # Joined with a timeout so Ctrl-C still reaches the main thread
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(0.5)
+    except KeyboardInterrupt:
+        print("\nStopping replication stream...")
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        sink.close()
+        for consumer in consumers:
+            consumer.close()
+    for slot, e in errors:
+        print(f"Error during replication of slot {slot}: {e}")
+
+
+def main():
+    configs = slot_configs()
+    several = len(configs) > 1
+
+    # Slots on the same database share its relation cache
+    caches = {}
+    consumers = []
+    for config in configs:
+        key = database_key(config.conn_params)
+        if key not in caches:
+            caches[key] = RelationCache(config.conn_params, relation_filter.copy())
+        capture = None
+        if CAPTURE_FILE:
+            root, ext = os.path.splitext(CAPTURE_FILE)
+            capture = CaptureWriter(f"{root}.{config.slot}{ext}" if several else CAPTURE_FILE)
+        consumers.append(SlotConsumer(config.slot, config.publication, caches[key],
+                                      ReplicationMetrics(config.slot or ''), capture, config.conn_params))
+
+    metrics = MetricsGroup([consumer.metrics for consumer in consumers]) if several else consumers[0].metrics
+    if METRICS_PORT:
+        serve_metrics(metrics, METRICS_PORT)
+    if METRICS_TEXTFILE:
+        start_textfile_writer(metrics, METRICS_TEXTFILE, int(os.getenv('METRICS_TEXTFILE_INTERVAL', '15')))
+    try:
+        for consumer in consumers:
+            consumer.start()
+        writer = get_sink_writer(SINK, conn_params)
+        if AA_CLEANUP:
+            writer = watch_booking_status(writer)
+        # One sink batches the committed transactions of all slots
+        sink = BatchingSink(writer, None, SINK_BATCH_ROWS, SINK_BATCH_MS, metrics)
+        consume_slots(consumers, sink)
+    except Exception as e:
+        print(f"Error during replication: {e}")
+    finally:
+        # Close PostgreSQL connections
+        for consumer in consumers:
+            consumer.close()
+        for cache in caches.values():
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
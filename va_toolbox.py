@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+va-toolbox: one entry point for the tools.
+
+Usage: python va_toolbox.py [--profile] <command> [args ...]
+
+Commands:
+  track           follow the replication stream into the sink (track_db.py)
+  clean-persons   delete the AA persons of finished bookings and orphaned
+                  credentials (assaabloy/clean_aa_persons.py) [--incremental]
+  clean-bookings  soft delete the due bookings of buildings
+                  (clean_bookings_from_building.py) [building code ...]
+
+Only the selected command's module is imported, so each command loads just
+the libraries it uses. .env is read once, and the database pool and AA HTTP
+session are opened on first use and shared by everything in the process
+(see resources.py); nothing connects or logs in at import.
+
+--profile (or TOOLBOX_PROFILE=on) prints to stderr when each startup step
+began and how long it took: loading .env, importing the command, opening
+the pool and session, and the first AA login. For a per-module breakdown of
+the imports run with python -X importtime.
+"""
+import os
+import sys
+
+import resources
+
+# command -> (module with a main(), summary)
+COMMANDS = {
+    'track': ('track_db', "follow the replication stream into the sink"),
+    'clean-persons': ('assaabloy.clean_aa_persons', "delete AA persons of finished bookings"),
+    'clean-bookings': ('clean_bookings_from_building', "soft delete due bookings of buildings"),
+}
+
+
+def usage(out):
+    print("usage: va_toolbox.py [--profile] <command> [args ...]\n\ncommands:", file=out)
+    for command, (_, summary) in COMMANDS.items():
+        print(f"  {command:<16}{summary}", file=out)
+
+
+def print_profile(out):
+    print("startup profile (ms since start, duration):", file=out)
+    for label, offset, seconds in sorted(resources.timings, key=lambda timing: timing[1]):
+        print(f"  {offset * 1000:>9.1f} {seconds * 1000:>9.1f}  {label}", file=out)
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    profile = os.getenv('TOOLBOX_PROFILE', 'off') == 'on'
+    while argv and argv[0].startswith('-'):
+        option = argv.pop(0)
+        if option == '--profile':
+            profile = True
+        elif option in ('-h', '--help'):
+            usage(sys.stdout)
+            return 0
+        else:
+            print(f"unknown option: {option}", file=sys.stderr)
+            usage(sys.stderr)
+            return 2
+    if not argv or argv[0] not in COMMANDS:
+        if argv:
+            print(f"unknown command: {argv[0]}", file=sys.stderr)
+        usage(sys.stderr)
+        return 2
+    command, args = argv[0], argv[1:]
+    module_name = COMMANDS[command][0]
+
+    resources.load_env()
+    with resources.timed(f"import {module_name}"):
+        module = __import__(module_name, fromlist=['main'])
+    # The tools read their own arguments from sys.argv
+    sys.argv = [f"va-toolbox {command}"] + args
+    try:
+        with resources.timed(command):
+            result = module.main()
+            if hasattr(result, '__await__'):  # async tools run on one loop that closes the shared resources
+                result = resources.run(result)
+    finally:
+        if profile:
+            print_profile(sys.stderr)
+    return result if isinstance(result, int) else 0  # a tool's main() may return an exit status
+
+
+if __name__ == "__main__":
+    sys.exit(main())